@@ -0,0 +1,115 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from capture import LazyThread
+
+# Frames classified per second while anyone is watching (0 disables the loop)
+ANALYSIS_FPS = float(os.environ.get("ANALYSIS_FPS", 2))
+# Pause the loop after this many seconds without subscribers or lookups
+ANALYSIS_IDLE_SECONDS = float(os.environ.get("ANALYSIS_IDLE_SECONDS", 30))
+# Emotions whose combined probability is reported as the stress score
+STRESS_EMOTIONS = ("Angry", "Disgust", "Fear", "Sad")
+
+
+def stress_score(probabilities, labels):
+    """Sum of the STRESS_EMOTIONS probabilities, 0..1. Works on one (C,) vector
+    or an (N, C) array of them."""
+    columns = [i for i, label in enumerate(labels) if label in STRESS_EMOTIONS]
+    return np.asarray(probabilities, dtype=np.float32)[..., columns].sum(axis=-1)
+
+
+def describe_face(box, probabilities, labels):
+    """JSON-ready dict for one classified face (box is None for a whole frame)."""
+    probabilities = np.asarray(probabilities, dtype=np.float32).reshape(-1)
+    return {
+        "emotion": labels[int(np.argmax(probabilities))],
+        "probabilities": {label: round(float(p), 4) for label, p in zip(labels, probabilities)},
+        "box": [int(v) for v in box] if box is not None else None,
+    }
+
+
+class EmotionAnalyzer:
+    """Background loop that classifies sampled camera frames and publishes
+    the latest result to any number of readers.
+
+    `classify(frame)` returns one (box, probabilities) pair per face, main
+    face first, with probabilities in `labels` order (box is None when the
+    whole frame was classified). `advice_fn(emotion)` (optional) adds advice
+    text to each result. Results are plain dicts describing the main face plus
+    a "faces" list; `event` holds the same result pre-serialized as a
+    server-sent event so streaming it to many clients costs nothing extra.
+    """
+
+    def __init__(self, capture, classify, labels, advice_fn=None,
+                 fps=ANALYSIS_FPS, idle_seconds=ANALYSIS_IDLE_SECONDS):
+        self.capture = capture
+        self.classify = classify
+        self.labels = list(labels)
+        self.advice_fn = advice_fn
+        self.period = 1.0 / fps
+        self.idle_seconds = idle_seconds
+        self.version = 0
+        self.result = None
+        self.event = None
+        self._cond = threading.Condition()
+        self._wake = threading.Event()
+        self._last_demand = 0.0
+        self._thread = LazyThread(self._run, "emotion-analyzer")
+
+    def start(self):
+        self._last_demand = time.monotonic()
+        self._wake.set()
+        self._thread.ensure_started()
+        return self
+
+    def latest(self):
+        """Newest published result (or None) without waiting."""
+        self.start()
+        return self.result
+
+    def wait_next(self, after_version, timeout=15.0):
+        """Wait for a result newer than after_version; returns (version, result, event)."""
+        self.start()
+        with self._cond:
+            self._cond.wait_for(lambda: self.version > after_version, timeout)
+            return self.version, self.result, self.event
+
+    def publish(self, faces, frame_seq=None):
+        faces = [describe_face(box, probabilities, self.labels) for box, probabilities in faces]
+        emotion = faces[0]["emotion"]
+        result = {
+            "emotion": emotion,
+            "probabilities": faces[0]["probabilities"],
+            "faces": faces,
+            "timestamp": time.time(),
+            "frame_seq": frame_seq,
+        }
+        if self.advice_fn is not None:
+            result["advice"] = self.advice_fn(emotion)
+        event = f"data: {json.dumps(result)}\n\n"
+        with self._cond:
+            self.version += 1
+            self.result = result
+            self.event = event
+            self._cond.notify_all()
+
+    def _run(self):
+        last_seq = 0
+        while True:
+            if time.monotonic() - self._last_demand > self.idle_seconds:
+                # Nobody is listening; sleep until the next subscriber or lookup
+                self._wake.clear()
+                self._wake.wait()
+            started = time.monotonic()
+            seq, frame = self.capture.wait_next(last_seq)
+            if frame is not None and seq != last_seq:
+                last_seq = seq
+                try:
+                    self.publish(self.classify(frame), seq)
+                except Exception as e:
+                    print(f"Warning: background analysis failed: {e}")
+            time.sleep(max(0.0, self.period - (time.monotonic() - started)))
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Offline emotion/stress timeline for recorded video files.
+
+Any file cv2.VideoCapture can open is split into time ranges that are decoded
+in parallel by worker processes. Each worker keeps every --stride-th frame,
+finds the face with the same FaceTracker the live app uses and returns 48x48
+crops. The main process runs the crops through the emotion model in large
+batches. Writes <name>_timeline.csv (one row per sampled frame) and
+<name>_summary.json next to it.
+
+Usage:
+    python analyze_video.py session.mp4
+    python analyze_video.py session.mp4 --stride 15 --workers 8 --shard-seconds 30
+    python analyze_video.py a.mp4 b.avi --model model/emotion_model_int8.tflite
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from analysis import stress_score
+
+emotion_labels = ["Angry", "Disgust", "Fear", "Happy", "Neutral", "Sad", "Surprise"]
+IMAGE_SIZE = 48
+
+
+def video_info(path):
+    """(fps, frame count) of a video; frame count is 0 when the container does not say."""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise SystemExit(f"Cannot open video {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+    frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    cap.release()
+    return (fps if fps > 0 else 30.0), max(0, frames)
+
+
+def plan_shards(frame_count, fps, stride, shard_seconds):
+    """Split [0, frame_count) into (start, end) frame ranges of about shard_seconds.
+
+    Boundaries fall on multiples of stride so the sampled frames are the same
+    however the video is split. Unknown lengths become one open-ended shard.
+    """
+    if frame_count <= 0:
+        return [(0, None)]
+    step = max(stride, int(round(shard_seconds * fps / stride)) * stride)
+    return [(start, min(start + step, frame_count)) for start in range(0, frame_count, step)]
+
+
+def decode_shard(task):
+    """Decode one time range of a video and return its sampled face crops.
+
+    Runs inside worker processes. Returns (frame indices, uint8 crops of shape
+    (N, 48, 48), face-found mask, face boxes (N, 4) with -1 where no face).
+    """
+    from face_tracking import FaceTracker, crop_box
+
+    path, start, end, stride = task
+    cap = cv2.VideoCapture(path)
+    if start:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    tracker = FaceTracker()
+    indices, crops, found, boxes = [], [], [], []
+    index = start
+    while end is None or index < end:
+        if index % stride:
+            # grab() skips the frame without converting it
+            if not cap.grab():
+                break
+            index += 1
+            continue
+        ok, frame = cap.read()
+        if not ok:
+            break
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        box = tracker.update(gray)
+        face = crop_box(gray, box) if box is not None else gray
+        crops.append(cv2.resize(face, (IMAGE_SIZE, IMAGE_SIZE), interpolation=cv2.INTER_AREA))
+        indices.append(index)
+        found.append(box is not None)
+        boxes.append(box if box is not None else (-1, -1, -1, -1))
+        index += 1
+    cap.release()
+    if not crops:
+        return (np.zeros(0, dtype=np.int64), np.zeros((0, IMAGE_SIZE, IMAGE_SIZE), dtype=np.uint8),
+                np.zeros(0, dtype=bool), np.zeros((0, 4), dtype=np.int32))
+    return (np.asarray(indices, dtype=np.int64), np.stack(crops),
+            np.asarray(found, dtype=bool), np.asarray(boxes, dtype=np.int32))
+
+
+def load_model(path=None):
+    """The serving model (inference.get_model) or a specific .h5/.tflite file."""
+    import inference
+    if path is None:
+        return inference.get_model()
+    if path.endswith(".tflite"):
+        return inference.TFLiteModel(path)
+    return inference.import_tensorflow().keras.models.load_model(path)
+
+
+def predict_crops(model, crops, batch_size):
+    probabilities = np.zeros((len(crops), len(emotion_labels)), dtype=np.float32)
+    for start in range(0, len(crops), batch_size):
+        batch = crops[start:start + batch_size][..., np.newaxis].astype(np.float32) / 255.0
+        probabilities[start:start + len(batch)] = np.asarray(model.predict_on_batch(batch))
+    return probabilities
+
+
+def analyze_video(path, model, stride, workers, shard_seconds, batch_size):
+    """Return (timeline arrays dict, fps) for one video."""
+    fps, frame_count = video_info(path)
+    tasks = [(path, start, end, stride) for start, end in plan_shards(frame_count, fps, stride, shard_seconds)]
+    parts = {"frame": [], "face": [], "box": [], "probabilities": []}
+    # spawn keeps TensorFlow (already loaded in this process) out of the workers;
+    # shards arrive in order and each is batched through the model as it lands
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks)),
+                             mp_context=multiprocessing.get_context("spawn")) as pool:
+        for indices, crops, found, boxes in pool.map(decode_shard, tasks):
+            parts["frame"].append(indices)
+            parts["face"].append(found)
+            parts["box"].append(boxes)
+            parts["probabilities"].append(predict_crops(model, crops, batch_size))
+    timeline = {name: np.concatenate(values) for name, values in parts.items()}
+    timeline["time"] = timeline["frame"] / fps
+    timeline["stress"] = stress_score(timeline["probabilities"], emotion_labels)
+    return timeline, fps
+
+
+def write_timeline(path, timeline):
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["time_s", "frame", "face", "x", "y", "w", "h", "emotion", "confidence", "stress"]
+                        + emotion_labels)
+        predicted = timeline["probabilities"].argmax(axis=1)
+        for i in range(len(timeline["frame"])):
+            probabilities = timeline["probabilities"][i]
+            writer.writerow([f"{timeline['time'][i]:.3f}", int(timeline["frame"][i]), int(timeline["face"][i])]
+                            + [int(v) for v in timeline["box"][i]]
+                            + [emotion_labels[predicted[i]], f"{probabilities[predicted[i]]:.4f}",
+                               f"{timeline['stress'][i]:.4f}"]
+                            + [f"{p:.4f}" for p in probabilities])
+
+
+def summarize(timeline, bucket_seconds=60.0):
+    """Emotion shares and stress statistics over the frames where a face was found,
+    plus mean stress per bucket_seconds window."""
+    face = timeline["face"]
+    if not face.any():
+        return {"frames_with_face": 0}
+    probabilities = timeline["probabilities"][face]
+    stress = timeline["stress"][face]
+    times = timeline["time"][face]
+    counts = np.bincount(probabilities.argmax(axis=1), minlength=len(emotion_labels))
+    buckets = (times // bucket_seconds).astype(np.int64)
+    samples_per_bucket = np.bincount(buckets)
+    per_bucket = np.bincount(buckets, weights=stress) / np.maximum(samples_per_bucket, 1)
+    peak = int(stress.argmax())
+    return {
+        "frames_with_face": int(face.sum()),
+        "emotion_share": {label: float(c / face.sum()) for label, c in zip(emotion_labels, counts)},
+        "mean_probabilities": {label: float(p) for label, p in zip(emotion_labels, probabilities.mean(axis=0))},
+        "stress_mean": float(stress.mean()),
+        "stress_peak": float(stress[peak]),
+        "stress_peak_time_s": float(times[peak]),
+        "stress_by_window": [{"start_s": float(i * bucket_seconds), "stress": float(v)}
+                             for i, v in enumerate(per_bucket) if samples_per_bucket[i]],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build emotion/stress timelines for recorded videos.")
+    parser.add_argument("videos", nargs="+")
+    parser.add_argument("--model", help=".h5 or .tflite file (default: the serving model from MODEL_PATH/INFERENCE_BACKEND)")
+    parser.add_argument("--stride", type=int, default=10, help="analyse every Nth frame")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="decode processes")
+    parser.add_argument("--shard-seconds", type=float, default=60.0, help="video time per worker task")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--window-seconds", type=float, default=60.0, help="stress averaging window in the summary")
+    parser.add_argument("--output-dir", default="predictions")
+    args = parser.parse_args()
+    stride = max(1, args.stride)
+
+    model = load_model(args.model)
+    os.makedirs(args.output_dir, exist_ok=True)
+    for video in args.videos:
+        started = time.perf_counter()
+        timeline, fps = analyze_video(video, model, stride, args.workers, args.shard_seconds, args.batch_size)
+        elapsed = time.perf_counter() - started
+
+        base = os.path.join(args.output_dir, os.path.splitext(os.path.basename(video))[0])
+        write_timeline(base + "_timeline.csv", timeline)
+        duration = float(timeline["time"][-1]) if len(timeline["time"]) else 0.0
+        summary = {
+            "video": video,
+            "model": args.model or "serving default",
+            "fps": fps,
+            "stride": stride,
+            "samples": int(len(timeline["frame"])),
+            "duration_s": duration,
+            "seconds": elapsed,
+            "realtime_factor": duration / elapsed if elapsed > 0 else None,
+        }
+        summary.update(summarize(timeline, args.window_seconds))
+        with open(base + "_summary.json", "w") as file:
+            json.dump(summary, file, indent=2)
+        print(f"{video}: {summary['samples']} samples over {duration:.1f}s of video in {elapsed:.2f}s "
+              f"({summary['realtime_factor'] or 0:.1f}x realtime) -> {base}_timeline.csv")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Async (ASGI) serving mode for main.py.
+
+/video_feed and /events run as async generators. Any number of streams
+waiting for the next frame or result share one background thread, so
+hundreds of open connections cost no worker threads. All other routes
+(/, /get_advice, /api/predict, ...) are the unchanged Flask views, run by
+a2wsgi in a bounded thread pool.
+
+Run with:
+    uvicorn asgi:app --host 0.0.0.0 --port $PORT
+or under gunicorn:
+    gunicorn -k uvicorn.workers.UvicornWorker -w 1 asgi:app
+"""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+from a2wsgi import WSGIMiddleware
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import parse_cookie
+
+import main
+
+# Threads for blocking OpenCV/encode calls made by the async streams
+ASGI_BLOCKING_THREADS = int(os.environ.get("ASGI_BLOCKING_THREADS", 8))
+# Threads running the regular Flask views
+ASGI_WSGI_THREADS = int(os.environ.get("ASGI_WSGI_THREADS", 16))
+
+executor = ThreadPoolExecutor(max_workers=ASGI_BLOCKING_THREADS, thread_name_prefix="asgi-blocking")
+flask_app = WSGIMiddleware(main.app, workers=ASGI_WSGI_THREADS)
+
+
+async def run_blocking(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+
+class AsyncBroadcast:
+    """Fans out a blocking `wait_next(after) -> (version, ...)` source to any
+    number of coroutines.
+
+    A single executor thread waits on the source while at least one
+    coroutine is listening; each new version wakes every listener at once.
+    """
+
+    def __init__(self, wait_next, initial):
+        self.wait_next = wait_next
+        self.latest = initial
+        self.listeners = 0
+        self._changed = None
+        self._pump = None
+
+    async def next(self, after, timeout=15.0):
+        """Return the newest (version, ...) tuple once version > after, or the
+        current one after timeout seconds."""
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        self.listeners += 1
+        try:
+            if self._pump is None or self._pump.done():
+                self._pump = asyncio.ensure_future(self._run())
+            if self.latest[0] <= after:
+                changed = self._changed
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            return self.latest
+        finally:
+            self.listeners -= 1
+
+    async def _run(self):
+        while self.listeners > 0:
+            latest = await run_blocking(self.wait_next, self.latest[0])
+            if latest[0] != self.latest[0]:
+                self.latest = latest
+                changed, self._changed = self._changed, asyncio.Event()
+                changed.set()
+
+
+_frames = None
+_results = None
+
+
+def _broadcasts():
+    global _frames, _results
+    if _frames is None and main.capture is not None:
+        _frames = AsyncBroadcast(main.capture.wait_next, (0, None))
+    if _results is None and main.analyzer is not None:
+        _results = AsyncBroadcast(main.analyzer.wait_next, (0, None, None))
+    return _frames, _results
+
+
+async def video_frames(fps, width, quality):
+    """Async twin of main.generate_frames()."""
+    await run_blocking(main.init_camera)
+    frames, _ = _broadcasts()
+    period = 1.0 / fps
+    last_seq = 0
+    loop = asyncio.get_running_loop()
+    main.ACTIVE_STREAMS.inc()
+    try:
+        while True:
+            started = loop.time()
+            if frames is None:
+                chunk = await run_blocking(main.placeholder_chunk, "Camera not available", width, quality)
+                interval = main.PLACEHOLDER_INTERVAL
+            else:
+                seq, frame = await frames.next(last_seq, timeout=1.0)
+                if seq > last_seq and frame is not None:
+                    last_seq = seq
+                    encoded = await run_blocking(main.frame_cache.get, seq, frame, quality, width)
+                    chunk, interval = encoded.chunk, period
+                else:
+                    message = "Camera read failed" if main.camera_connected() else "Camera not available"
+                    chunk = await run_blocking(main.placeholder_chunk, message, width, quality)
+                    interval = main.PLACEHOLDER_INTERVAL
+            yield chunk
+            remaining = interval - (loop.time() - started)
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+    finally:
+        main.ACTIVE_STREAMS.dec()
+
+
+async def result_events(history=None):
+    """Async twin of the /events stream in main.py."""
+    _, results = _broadcasts()
+    version = 0
+    while True:
+        new_version, result, event = await results.next(version)
+        if new_version == version or event is None:
+            yield b": keepalive\n\n"
+        else:
+            version = new_version
+            if history is not None:
+                await run_blocking(main.record_result, history, result)
+            yield event.encode("utf-8")
+
+
+def scope_session(scope):
+    """The session history named by the request's cookie, if it has a valid one."""
+    for name, value in scope.get("headers", ()):
+        if name == b"cookie":
+            session_id = parse_cookie(value.decode("latin-1")).get(main.SESSION_COOKIE)
+            if main.valid_session_id(session_id):
+                return main.sessions.get(session_id)
+    return None
+
+
+async def stream_response(receive, send, body, content_type, headers=()):
+    """Send an async iterator of chunks until it ends or the client disconnects."""
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", content_type.encode("latin-1"))] + list(headers),
+    })
+
+    async def pump():
+        async for chunk in body:
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+
+    async def wait_disconnect():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    tasks = [asyncio.ensure_future(pump()), asyncio.ensure_future(wait_disconnect())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await body.aclose()
+    try:
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+    except Exception:
+        pass  # client already gone
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            # Load and warm the model in the background; /ready reports 503 until it is done
+            main.load_model_async()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            executor.shutdown(wait=False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+
+    path = scope.get("path")
+    if scope["type"] == "http" and path == "/video_feed":
+        args = MultiDict(parse_qsl(scope.get("query_string", b"").decode("latin-1")))
+        fps, width, quality = main.stream_options(args)
+        await stream_response(receive, send, video_frames(fps, width, quality),
+                              "multipart/x-mixed-replace; boundary=frame")
+        return
+
+    if scope["type"] == "http" and path == "/events":
+        await run_blocking(main.init_camera)
+        if main.analyzer is not None:
+            history = await run_blocking(scope_session, scope)
+            await stream_response(receive, send, result_events(history), "text/event-stream",
+                                  [(b"cache-control", b"no-cache"), (b"x-accel-buffering", b"no")])
+            return
+        # Without a camera, let Flask answer with its usual 503 JSON
+
+    await flask_app(scope, receive, send)
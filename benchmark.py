@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Stage-level benchmark for the request path in main.py.
+
+Uses synthetic frames (no camera needed) and times each stage of
+get_advice separately, then measures generate_frames() throughput with
+several concurrent consumers. Results are written as JSON so runs can be
+compared.
+
+Usage:
+    python benchmark.py
+    python benchmark.py --iterations 500 --consumers 1 4 16 --output bench.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+class SyntheticCamera:
+    """Stands in for cv2.VideoCapture: returns copies of one frame at a fixed rate."""
+
+    def __init__(self, frame, fps=30.0):
+        self.frame = frame
+        self.period = 1.0 / fps if fps > 0 else 0.0
+        self._next = time.monotonic()
+
+    def read(self):
+        if self.period:
+            self._next += self.period
+            delay = self._next - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                self._next = time.monotonic()
+        return True, self.frame.copy()
+
+    def isOpened(self):
+        return True
+
+    def release(self):
+        pass
+
+
+def synthetic_frame(width=640, height=480, seed=0):
+    """Noisy background with a dataset face pasted in, so face detection has work to do."""
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    faces = sorted(glob.glob(os.path.join("dataset", "train", "happy", "*.jpg")))
+    if faces:
+        face = cv2.resize(cv2.imread(faces[0]), (height // 2, height // 2))
+        y, x = height // 4, (width - face.shape[1]) // 2
+        frame[y:y + face.shape[0], x:x + face.shape[1]] = face
+    return frame
+
+
+def summarize(samples):
+    """Latency percentiles in milliseconds plus single-thread throughput."""
+    samples = np.asarray(samples, dtype=np.float64)
+    total = samples.sum()
+    return {
+        "n": int(samples.size),
+        "mean_ms": float(samples.mean() * 1000),
+        "p50_ms": float(np.percentile(samples, 50) * 1000),
+        "p95_ms": float(np.percentile(samples, 95) * 1000),
+        "p99_ms": float(np.percentile(samples, 99) * 1000),
+        "throughput_per_s": float(samples.size / total) if total > 0 else None,
+    }
+
+
+def time_stage(fn, iterations, warmup=5):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+def bench_stages(app, iterations):
+    frame = app.capture.wait_next(0)[1]
+    face = app.preprocess_face(frame)
+    jpeg = app.encode_jpeg(frame)
+    snapshot_id = app.snapshot_store.put(jpeg)
+    model = app.get_model()
+    # The Keras model behind the traced wrapper, for comparison with plain predict()
+    keras_model = getattr(model, "model", model)
+    client = app.app.test_client()
+
+    def render():
+        with app.app.test_request_context():
+            app.render_template("result.html", emotion="Happy", advice=app.get_solution("Happy"),
+                                img_url=f"/snapshot/{snapshot_id}.jpg", img_width=frame.shape[1],
+                                thumb_url=f"/snapshot/{snapshot_id}.jpg?size=thumb",
+                                thumb_width=app.THUMBNAIL_WIDTH)
+
+    stages = {
+        "frame_acquisition": lambda: app.capture.latest(),
+        "preprocess": lambda: app.preprocess_face(frame),
+        "model_predict": lambda: keras_model.predict(face[np.newaxis], verbose=0),
+        "traced_predict": lambda: model.predict_on_batch(face[np.newaxis]),
+        "batched_predict": lambda: app.batcher.predict(face),
+        "imencode": lambda: app.encode_jpeg(frame),
+        "snapshot_store": lambda: app.snapshot_store.put(jpeg),
+        "render_template": render,
+        "get_advice_total": lambda: client.get("/get_advice"),
+    }
+    results = {}
+    for name, fn in stages.items():
+        print(f"  {name}...")
+        results[name] = time_stage(fn, iterations)
+    return results
+
+
+def bench_streams(app, consumers, seconds, fps):
+    """Run `consumers` generate_frames() loops at once and count the chunks each receives."""
+    counts = [0] * consumers
+    gaps = [[] for _ in range(consumers)]
+    stop = threading.Event()
+
+    def consume(index):
+        last = time.perf_counter()
+        for _ in app.generate_frames(fps):
+            now = time.perf_counter()
+            counts[index] += 1
+            gaps[index].append(now - last)
+            last = now
+            if stop.is_set():
+                break
+
+    threads = [threading.Thread(target=consume, args=(i,), daemon=True) for i in range(consumers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join(timeout=5)
+    elapsed = time.perf_counter() - started
+
+    all_gaps = [gap for per_consumer in gaps for gap in per_consumer[1:]] or [0.0]
+    result = summarize(all_gaps)
+    del result["throughput_per_s"]
+    result.update({
+        "consumers": consumers,
+        "seconds": elapsed,
+        "frames_per_consumer_per_s": float(np.mean(counts) / elapsed),
+        "total_frames_per_s": float(sum(counts) / elapsed),
+    })
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark each stage of the main.py request path.")
+    parser.add_argument("--iterations", type=int, default=200, help="timed calls per stage")
+    parser.add_argument("--consumers", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--stream-seconds", type=float, default=3.0)
+    parser.add_argument("--camera-fps", type=float, default=30.0, help="synthetic camera rate (0 = unthrottled)")
+    parser.add_argument("--stream-fps", type=float, default=0.0,
+                        help="per-stream pacing cap (0 = unpaced, to measure encode throughput)")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    import main as app
+
+    # Swap in the synthetic camera and keep background analysis out of the timings
+    app.init_camera(SyntheticCamera(synthetic_frame(), args.camera_fps))
+    app.analyzer = None
+
+    print("Timing request stages...")
+    stages = bench_stages(app, args.iterations)
+    print("Timing video streams...")
+    stream_fps = args.stream_fps if args.stream_fps > 0 else float("inf")
+    streams = {str(n): bench_streams(app, n, args.stream_seconds, stream_fps) for n in args.consumers}
+
+    report = {
+        "meta": {
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "opencv": cv2.__version__,
+            "iterations": args.iterations,
+            "camera_fps": args.camera_fps,
+            "stream_fps": args.stream_fps,
+        },
+        "stages": stages,
+        "streams": streams,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output)
+        print(f"Results written to {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+Camera discovery and reconnection.
+
+discover_camera() probes device indices concurrently, each with a deadline,
+and remembers the last working (index, backend) in CAMERA_CACHE_FILE so the
+next start opens it directly. CameraSupervisor wraps the chosen device with
+the cv2.VideoCapture read() interface, runs discovery in a background thread
+and starts it again whenever reads keep failing (camera unplugged, driver
+reset, ...), so callers never wait for a device to open.
+"""
+
+import json
+import os
+import threading
+import time
+
+import cv2
+
+import metrics
+from capture import LazyThread
+
+CAMERA_MAX_INDEX = int(os.environ.get("CAMERA_MAX_INDEX", 4))
+# Seconds to wait for a device to open and deliver its first frame
+CAMERA_PROBE_TIMEOUT = float(os.environ.get("CAMERA_PROBE_TIMEOUT", 5.0))
+CAMERA_CACHE_FILE = os.environ.get("CAMERA_CACHE_FILE", ".camera_cache.json")
+# Consecutive failed reads before the device is dropped and rediscovered
+CAMERA_MAX_FAILURES = int(os.environ.get("CAMERA_MAX_FAILURES", 30))
+# Delay between discovery attempts while no camera is found
+CAMERA_RETRY_SECONDS = float(os.environ.get("CAMERA_RETRY_SECONDS", 10.0))
+
+CAMERA_CONNECTED = metrics.gauge("camera_connected", "1 while a camera device is open.")
+CAMERA_RECONNECTS = metrics.counter("camera_reconnects", "Times a camera was (re)opened after discovery.")
+
+
+def default_backend():
+    # On Windows prefer DirectShow, which is often more reliable for webcams
+    return cv2.CAP_DSHOW if os.name == 'nt' else cv2.CAP_ANY
+
+
+def open_camera(index, backend):
+    """Open one device and check that it delivers a frame. Returns the capture or None."""
+    cap = None
+    try:
+        cap = cv2.VideoCapture(index, backend)
+        if cap.isOpened():
+            ret, _ = cap.read()
+            if ret:
+                return cap
+    except Exception:
+        pass
+    if cap is not None:
+        cap.release()
+    return None
+
+
+def load_cached_camera(path=CAMERA_CACHE_FILE):
+    """(index, backend) saved by the last successful discovery, or None."""
+    try:
+        with open(path) as file:
+            data = json.load(file)
+        return int(data["index"]), int(data["backend"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def save_cached_camera(index, backend, path=CAMERA_CACHE_FILE):
+    try:
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump({"index": index, "backend": backend}, file)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Warning: could not write camera cache {path}: {e}")
+
+
+class _Probe:
+    """One device being opened in its own thread."""
+
+    def __init__(self, index, backend):
+        self.index = index
+        self.backend = backend
+        self.cap = None
+        self.done = threading.Event()
+
+
+def probe_cameras(candidates, timeout=CAMERA_PROBE_TIMEOUT):
+    """Open all (index, backend) candidates at once and return the first one,
+    in candidate order, that works within timeout seconds: (cap, index, backend).
+
+    Returns (None, None, None) if none do. Probes that hang are abandoned (their
+    threads are daemons) and any device they open later is released.
+    """
+    lock = threading.Lock()
+    finished = [False]
+
+    def run(probe):
+        cap = open_camera(probe.index, probe.backend)
+        with lock:
+            late = finished[0]
+            if not late:
+                probe.cap = cap
+        if late and cap is not None:
+            cap.release()
+        probe.done.set()
+
+    probes = [_Probe(index, backend) for index, backend in candidates]
+    for probe in probes:
+        threading.Thread(target=run, args=(probe,), name=f"camera-probe-{probe.index}", daemon=True).start()
+
+    deadline = time.monotonic() + timeout
+    chosen = None
+    for probe in probes:
+        # Earlier candidates are preferred, so wait for each in turn until the deadline
+        probe.done.wait(max(0.0, deadline - time.monotonic()))
+        if probe.done.is_set() and probe.cap is not None:
+            chosen = probe
+            break
+
+    with lock:
+        finished[0] = True
+        extra = [p.cap for p in probes if p is not chosen and p.cap is not None]
+    for cap in extra:
+        cap.release()
+    if chosen is None:
+        return None, None, None
+    return chosen.cap, chosen.index, chosen.backend
+
+
+def discover_camera(max_index=CAMERA_MAX_INDEX, timeout=CAMERA_PROBE_TIMEOUT, cache_path=CAMERA_CACHE_FILE):
+    """Find a working camera: the cached device first, then every index in parallel.
+
+    A CAMERA_INDEX env var puts that index first. Returns (cap, index, backend)
+    or (None, None, None).
+    """
+    backend = default_backend()
+    indices = list(range(max_index + 1))
+    try:
+        env_index = os.environ.get("CAMERA_INDEX")
+        if env_index is not None:
+            env_index = int(env_index)
+            indices = [env_index] + [i for i in indices if i != env_index]
+    except ValueError:
+        pass
+    candidates = [(i, backend) for i in indices]
+
+    cached = load_cached_camera(cache_path) if cache_path else None
+    if cached is not None:
+        # Usually the same device as last time: open just that one
+        cap, index, cached_backend = probe_cameras([cached], timeout)
+        if cap is not None:
+            return cap, index, cached_backend
+        candidates = [c for c in candidates if c != cached]
+
+    cap, index, backend = probe_cameras(candidates, timeout)
+    if cap is not None and cache_path:
+        save_cached_camera(index, backend, cache_path)
+    return cap, index, backend
+
+
+class CameraSupervisor:
+    """A cv2.VideoCapture stand-in that finds, and keeps re-finding, the camera.
+
+    read() never waits for discovery: while no device is open it returns
+    (False, None) after at most `wait` seconds. After max_failures failed reads
+    in a row the device is released and discovery starts again.
+    """
+
+    def __init__(self, max_index=CAMERA_MAX_INDEX, probe_timeout=CAMERA_PROBE_TIMEOUT,
+                 cache_path=CAMERA_CACHE_FILE, max_failures=CAMERA_MAX_FAILURES,
+                 retry_seconds=CAMERA_RETRY_SECONDS):
+        self.max_index = max_index
+        self.probe_timeout = probe_timeout
+        self.cache_path = cache_path
+        self.max_failures = max(1, max_failures)
+        self.retry_seconds = retry_seconds
+        self.index = None
+        self.backend = None
+        self._camera = None
+        self._failures = 0
+        self._connected = threading.Event()
+        self._lost = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = LazyThread(self._run, "camera-supervisor", on_start=self._reset)
+        CAMERA_CONNECTED.set_function(lambda: self.connected)
+
+    @property
+    def connected(self):
+        return self._connected.is_set()
+
+    def start(self):
+        self._thread.ensure_started()
+        return self
+
+    def _reset(self):
+        # A device opened by the parent process is not usable here
+        self._camera = None
+        self._connected.clear()
+
+    def wait_connected(self, timeout=None):
+        return self.start()._connected.wait(timeout)
+
+    def isOpened(self):
+        return self.connected
+
+    def read(self, wait=1.0):
+        self.start()
+        cam = self._camera
+        if cam is None:
+            self._connected.wait(wait)
+            return False, None
+        try:
+            success, frame = cam.read()
+        except Exception as e:
+            print(f"Warning: camera read raised: {e}")
+            success, frame = False, None
+        if success and frame is not None:
+            self._failures = 0
+            return True, frame
+        self._failures += 1
+        if self._failures >= self.max_failures:
+            self._disconnect(cam)
+        return False, None
+
+    def release(self):
+        self._disconnect(self._camera)
+
+    def _disconnect(self, cam):
+        with self._lock:
+            if cam is None or self._camera is not cam:
+                return
+            self._camera = None
+            self._connected.clear()
+        print(f"Warning: camera {self.index} stopped delivering frames; searching again.")
+        cam.release()
+        self._lost.set()
+
+    def _run(self):
+        warned = False
+        while True:
+            cap, index, backend = discover_camera(self.max_index, self.probe_timeout, self.cache_path)
+            if cap is None:
+                if not warned:
+                    print("Warning: No working camera found. The app will use a placeholder image "
+                          "and random emotions, and keeps looking in the background.")
+                    warned = True
+                time.sleep(self.retry_seconds)
+                continue
+            warned = False
+            print(f"Using camera index {index}")
+            with self._lock:
+                self.index, self.backend = index, backend
+                self._camera = cap
+                self._failures = 0
+                self._lost.clear()
+                self._connected.set()
+            CAMERA_RECONNECTS.inc()
+            self._lost.wait()
@@ -0,0 +1,203 @@
+import collections
+import os
+import threading
+import time
+
+import cv2
+
+import metrics
+
+# Default JPEG quality for streamed and snapshot frames (OpenCV's own default is 95)
+JPEG_QUALITY = int(os.environ.get("JPEG_QUALITY", 95))
+
+EncodedFrame = collections.namedtuple("EncodedFrame", ["jpeg", "chunk"])
+
+CAMERA_FRAMES = metrics.counter("camera_frames", "Frames read from the camera.")
+CAMERA_READ_FAILURES = metrics.counter("camera_read_failures", "Failed camera reads.")
+JPEG_ENCODE_SECONDS = metrics.histogram("jpeg_encode_seconds", "Time spent JPEG-encoding one frame.")
+JPEG_CACHE_REQUESTS = metrics.counter(
+    "jpeg_cache_requests", "Encoded-frame cache lookups by result.", ["result"])
+
+
+def encode_jpeg(frame, quality=JPEG_QUALITY):
+    with JPEG_ENCODE_SECONDS.time():
+        ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    if not ok:
+        raise ValueError("JPEG encoding failed")
+    return buffer.tobytes()
+
+
+def resize_to_width(frame, width):
+    """Downscale frame to `width` pixels wide (keeping aspect); never upscales."""
+    if not width or width >= frame.shape[1]:
+        return frame
+    height = max(1, round(frame.shape[0] * width / frame.shape[1]))
+    return cv2.resize(frame, (int(width), height), interpolation=cv2.INTER_AREA)
+
+
+def multipart_chunk(jpeg):
+    return (b'--frame\r\n'
+            b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
+
+
+class LazyThread:
+    """A daemon thread that is started on first use, once per process.
+
+    Threads do not survive fork(), so objects built in the gunicorn master
+    start their background thread lazily in whichever process uses them.
+    `on_start` runs just before a new thread starts, to reset state that
+    must not be shared with the parent process.
+    """
+
+    def __init__(self, target, name, on_start=None):
+        self.target = target
+        self.name = name
+        self.on_start = on_start
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            if self.on_start is not None:
+                self.on_start()
+            self._thread = threading.Thread(target=self.target, name=self.name, daemon=True)
+            self._thread.start()
+
+
+class FrameRing:
+    """Small ring buffer of the most recent camera frames.
+
+    Every frame is tagged with an increasing sequence number so readers can tell
+    whether they have already seen it. Frames are shared between all readers
+    and must be treated as read-only; copy before drawing on them.
+    """
+
+    def __init__(self, size=4):
+        self._frames = collections.deque(maxlen=max(1, size))
+        self._cond = threading.Condition()
+        self.seq = 0
+        self.failed = False
+
+    def push(self, frame):
+        with self._cond:
+            self.seq += 1
+            self._frames.append((self.seq, time.time(), frame))
+            self.failed = False
+            self._cond.notify_all()
+
+    def mark_failed(self):
+        with self._cond:
+            self.failed = True
+            self._cond.notify_all()
+
+    def latest(self):
+        """Return (seq, frame) for the newest frame without waiting.
+
+        frame is None when nothing has been captured yet or the last read failed.
+        """
+        with self._cond:
+            if self.failed or not self._frames:
+                return self.seq, None
+            seq, _, frame = self._frames[-1]
+            return seq, frame
+
+    def wait_next(self, after_seq, timeout=1.0):
+        """Wait until a frame newer than after_seq exists and return it like
+        latest(). Gives up after timeout seconds."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.seq > after_seq, timeout)
+        return self.latest()
+
+
+class CaptureThread:
+    """Single background reader for a cv2.VideoCapture.
+
+    The thread is the only code that calls camera.read(); streams and advice
+    requests read from `frames` instead, so extra viewers cost no extra reads.
+    """
+
+    def __init__(self, camera, buffer_size=4, retry_delay=0.1):
+        self.camera = camera
+        self.frames = FrameRing(buffer_size)
+        self.retry_delay = retry_delay
+        self._thread = LazyThread(self._run, "camera-capture")
+
+    def start(self):
+        self._thread.ensure_started()
+        return self
+
+    def latest(self):
+        return self.start().frames.latest()
+
+    def wait_next(self, after_seq, timeout=1.0):
+        return self.start().frames.wait_next(after_seq, timeout)
+
+    def _run(self):
+        while True:
+            try:
+                success, frame = self.camera.read()
+            except Exception as e:
+                print(f"Warning: camera read raised: {e}")
+                success, frame = False, None
+            if success and frame is not None:
+                CAMERA_FRAMES.inc()
+                self.frames.push(frame)
+            else:
+                CAMERA_READ_FAILURES.inc()
+                self.frames.mark_failed()
+                time.sleep(self.retry_delay)
+
+
+class _PendingEncode:
+    __slots__ = ("ready", "value")
+
+    def __init__(self):
+        self.ready = threading.Event()
+        self.value = None
+
+
+class EncodedFrameCache:
+    """JPEG-encodes each captured frame at most once per quality and size.
+
+    Entries are keyed by (frame sequence number, quality, width). When several
+    streams ask for the same frame at once, the first one encodes it and the
+    others wait for its result instead of encoding it again.
+    """
+
+    def __init__(self, size=16):
+        self.size = max(1, size)
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, seq, frame, quality=JPEG_QUALITY, width=None):
+        key = (seq, int(quality), width)
+        with self._lock:
+            entry = self._entries.get(key)
+            owner = entry is None
+            if owner:
+                entry = self._entries[key] = _PendingEncode()
+                while len(self._entries) > self.size:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.move_to_end(key)
+        JPEG_CACHE_REQUESTS.labels("miss" if owner else "hit").inc()
+
+        if owner:
+            try:
+                jpeg = encode_jpeg(resize_to_width(frame, width), quality)
+                entry.value = EncodedFrame(jpeg, multipart_chunk(jpeg))
+            finally:
+                entry.ready.set()
+        else:
+            entry.ready.wait()
+            if entry.value is None:
+                # The owner's encode failed; try once more ourselves
+                jpeg = encode_jpeg(resize_to_width(frame, width), quality)
+                return EncodedFrame(jpeg, multipart_chunk(jpeg))
+        return entry.value
@@ -0,0 +1,147 @@
+import os
+import threading
+
+import cv2
+
+# Run the full face detector at least every FACE_DETECT_INTERVAL frames; in
+# between, the last face is followed by template matching.
+FACE_DETECT_INTERVAL = max(1, int(os.environ.get("FACE_DETECT_INTERVAL", 10)))
+# Tracking matches scoring below this (normalized correlation) trigger a re-detect
+FACE_TRACK_MIN_SCORE = float(os.environ.get("FACE_TRACK_MIN_SCORE", 0.6))
+# Detection and tracking run on a copy of the frame scaled down to this width
+FACE_WORK_WIDTH = int(os.environ.get("FACE_WORK_WIDTH", 320))
+# Most faces followed per frame by a multi-face tracker (largest first)
+FACE_MAX_FACES = max(1, int(os.environ.get("FACE_MAX_FACES", 8)))
+
+
+class FaceDetector:
+    """Finds faces with OpenCV's YuNet DNN detector when FACE_DETECTOR_MODEL
+    points at its ONNX file, otherwise with the bundled Haar cascade."""
+
+    def __init__(self, model_path=None, scale_factor=1.1, min_neighbors=5, min_size=(24, 24),
+                 score_threshold=0.7):
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = min_size
+        self.cascade = None
+        self.dnn = None
+
+        model_path = model_path or os.environ.get("FACE_DETECTOR_MODEL")
+        if model_path and hasattr(cv2, "FaceDetectorYN"):
+            try:
+                self.dnn = cv2.FaceDetectorYN.create(model_path, "", (320, 320), score_threshold)
+                return
+            except Exception as e:
+                print(f"Warning: could not load face detector model {model_path}: {e}")
+
+        if hasattr(cv2, "CascadeClassifier"):
+            cascade_path = os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml")
+            cascade = cv2.CascadeClassifier(cascade_path)
+            if not cascade.empty():
+                self.cascade = cascade
+                return
+        print("Warning: no face detector available; classifying whole frames.")
+
+    def detect(self, gray):
+        """Return face boxes (x, y, w, h) in gray, largest first."""
+        if self.dnn is not None:
+            self.dnn.setInputSize((gray.shape[1], gray.shape[0]))
+            _, faces = self.dnn.detect(cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR))
+            faces = [] if faces is None else [face[:4] for face in faces]
+        elif self.cascade is not None:
+            faces = self.cascade.detectMultiScale(
+                gray, scaleFactor=self.scale_factor, minNeighbors=self.min_neighbors, minSize=self.min_size)
+        else:
+            return []
+        boxes = [_clip_box(face, gray.shape) for face in faces]
+        return sorted((box for box in boxes if box[2] > 0 and box[3] > 0),
+                      key=lambda box: box[2] * box[3], reverse=True)
+
+
+def _clip_box(face, shape):
+    x, y, w, h = (int(round(v)) for v in face)
+    x0, y0 = max(0, x), max(0, y)
+    x1, y1 = min(shape[1], x + w), min(shape[0], y + h)
+    return (x0, y0, x1 - x0, y1 - y0)
+
+
+class FaceTracker:
+    """Follows up to `max_faces` faces across frames, re-running the detector
+    only every `detect_interval` frames or when any tracking match gets weak."""
+
+    def __init__(self, detector=None, detect_interval=FACE_DETECT_INTERVAL,
+                 min_score=FACE_TRACK_MIN_SCORE, work_width=FACE_WORK_WIDTH, search_margin=0.5,
+                 max_faces=1):
+        self.detector = detector or FaceDetector()
+        self.detect_interval = max(1, detect_interval)
+        self.min_score = min_score
+        self.work_width = work_width
+        self.search_margin = search_margin
+        self.max_faces = max(1, max_faces)
+        self.tracks = []  # (box, template) in work-image coordinates, largest first
+        self.frames_since_detect = 0
+        self._lock = threading.Lock()
+
+    def update(self, gray):
+        """Locate the main face in a grayscale frame; returns (x, y, w, h) in
+        frame coordinates, or None when no face is visible."""
+        boxes = self.update_all(gray)
+        return boxes[0] if boxes else None
+
+    def update_all(self, gray):
+        """Locate every tracked face in a grayscale frame; returns a list of
+        (x, y, w, h) boxes in frame coordinates, largest first."""
+        scale = min(1.0, self.work_width / float(gray.shape[1]))
+        small = gray if scale == 1.0 else cv2.resize(gray, None, fx=scale, fy=scale,
+                                                     interpolation=cv2.INTER_AREA)
+        with self._lock:
+            boxes = None
+            if self.tracks and self.frames_since_detect < self.detect_interval:
+                boxes = self._track(small)
+            if boxes is None:
+                boxes = self._detect(small)
+            else:
+                self.frames_since_detect += 1
+        return [(int(x / scale), int(y / scale), int(w / scale), int(h / scale)) for x, y, w, h in boxes]
+
+    def reset(self):
+        with self._lock:
+            self.tracks = []
+
+    def _detect(self, small):
+        faces = self.detector.detect(small)[:self.max_faces]
+        self.frames_since_detect = 0
+        self.tracks = [self._remember(small, box) for box in faces]
+        return list(faces)
+
+    def _track(self, small):
+        # All faces must still match; one lost face means a fresh detection
+        tracks = []
+        for (x, y, w, h), template in self.tracks:
+            pad_x, pad_y = int(w * self.search_margin), int(h * self.search_margin)
+            x0, y0 = max(0, x - pad_x), max(0, y - pad_y)
+            x1, y1 = min(small.shape[1], x + w + pad_x), min(small.shape[0], y + h + pad_y)
+            window = small[y0:y1, x0:x1]
+            if window.shape[0] < h or window.shape[1] < w:
+                return None
+            result = cv2.matchTemplate(window, template, cv2.TM_CCOEFF_NORMED)
+            _, score, _, (dx, dy) = cv2.minMaxLoc(result)
+            if not score >= self.min_score:  # also rejects NaN from flat templates
+                return None
+            tracks.append(self._remember(small, (x0 + dx, y0 + dy, w, h)))
+        self.tracks = tracks
+        return [box for box, _ in tracks]
+
+    @staticmethod
+    def _remember(small, box):
+        x, y, w, h = box
+        return box, small[y:y + h, x:x + w].copy()
+
+
+def crop_box(gray, box, margin=0.1):
+    """Crop box from gray with a small margin around it, clipped to the frame."""
+    x, y, w, h = box
+    pad_x, pad_y = int(w * margin), int(h * margin)
+    x0, y0 = max(0, x - pad_x), max(0, y - pad_y)
+    x1, y1 = min(gray.shape[1], x + w + pad_x), min(gray.shape[0], y + h + pad_y)
+    return gray[y0:y1, x0:x1]
@@ -0,0 +1,24 @@
+import os
+
+# Gunicorn settings for `gunicorn main:app` (picked up automatically from this file)
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 4))
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+
+# Import the app once in the master and fork workers from it, so every worker
+# shares the already-imported modules instead of importing them again
+preload_app = True
+
+
+def on_starting(server):
+    # TensorFlow's import is the slow part of startup; pay it once here. Model
+    # loading and camera setup stay lazy and happen inside each worker.
+    from inference import import_tensorflow
+    import_tensorflow()
+
+
+def post_worker_init(worker):
+    # Load and warm the model as soon as the worker exists rather than on the
+    # first request; /ready keeps answering 503 until the warmup has finished
+    from inference import load_model_async
+    load_model_async()
@@ -0,0 +1,66 @@
+import struct
+
+import cv2
+import numpy as np
+
+# Uploads are decoded at a reduced size as long as the short side stays at or above this
+DECODE_MIN_SIDE = 240
+
+_REDUCED_FLAGS = {
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+}
+# JPEG start-of-frame markers (C4, C8 and CC are other segment types)
+_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def image_size(data):
+    """(width, height) read from a PNG or JPEG header, or None if unknown."""
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        return struct.unpack(">II", data[16:24])
+    if data[:2] != b"\xff\xd8":
+        return None
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            i += 1
+            continue
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        length = struct.unpack(">H", data[i + 2:i + 4])[0]
+        if marker in _SOF_MARKERS:
+            height, width = struct.unpack(">HH", data[i + 5:i + 9])
+            return width, height
+        i += 2 + length
+    return None
+
+
+def decode_grayscale(data, min_side=DECODE_MIN_SIDE):
+    """Decode JPEG/PNG bytes straight to grayscale, letting the decoder shrink
+    the image by 2, 4 or 8 while the short side stays >= min_side.
+
+    Returns (gray image, scale factor back to the original resolution), or
+    (None, 1) if the bytes are not a readable image.
+    """
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    size = image_size(data)
+    factor = 1
+    if size is not None:
+        for candidate in (8, 4, 2):
+            if min(size) // candidate >= min_side:
+                factor = candidate
+                break
+    flag = _REDUCED_FLAGS.get(factor, cv2.IMREAD_GRAYSCALE)
+    image = cv2.imdecode(buffer, flag)
+    if image is None:
+        return None, 1
+    if size is not None and factor > 1:
+        # Reduced decodes round up odd sizes; report the real ratio
+        return image, size[0] / float(image.shape[1])
+    return image, 1
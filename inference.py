@@ -0,0 +1,334 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+import metrics
+from capture import LazyThread
+
+MODEL_PATH = os.environ.get("MODEL_PATH", "model/emotion_model.h5")
+# "keras" runs MODEL_PATH with Keras; "tflite" runs TFLITE_MODEL_PATH (see model/convert_tflite.py)
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "keras").lower()
+TFLITE_MODEL_PATH = os.environ.get("TFLITE_MODEL_PATH", "model/emotion_model_int8.tflite")
+TFLITE_THREADS = int(os.environ.get("TFLITE_THREADS", 0)) or None
+# Keras models run through a traced tf.function with one fixed input shape per
+# batch-size bucket (comma-separated); INFERENCE_TRACED=0 uses predict_on_batch
+INFERENCE_TRACED = os.environ.get("INFERENCE_TRACED", "1") != "0"
+INFERENCE_BUCKETS = os.environ.get("INFERENCE_BUCKETS", "")
+
+_model = None
+_model_error = None
+_model_lock = threading.Lock()
+_warmup_seconds = None
+
+MODEL_WARMUP_SECONDS = metrics.gauge(
+    "emotion_model_warmup_seconds", "Time spent loading and warming the model in this process.")
+MODEL_WARMUP_SECONDS.set_function(lambda: _warmup_seconds or 0.0)
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def import_tensorflow():
+    """Import TensorFlow without running any ops.
+
+    Safe to call in the gunicorn master before forking: the imported runtime
+    is shared copy-on-write with every worker. Creating or running a model is
+    not fork-safe, so that is left to get_model() inside each worker.
+    """
+    import tensorflow as tf
+    return tf
+
+
+class TFLiteModel:
+    """Runs a .tflite model behind the same predict_on_batch() call as Keras.
+
+    Float inputs are quantized (and outputs dequantized) automatically for
+    int8 models. Uses the standalone LiteRT (ai_edge_litert) or tflite_runtime
+    interpreter when installed, so serving does not need full TensorFlow.
+    """
+
+    def __init__(self, path, num_threads=TFLITE_THREADS):
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            try:
+                from tflite_runtime.interpreter import Interpreter
+            except ImportError:
+                Interpreter = import_tensorflow().lite.Interpreter
+        self.interpreter = Interpreter(model_path=path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self._batch_size = int(self.input["shape"][0])
+        self._lock = threading.Lock()
+
+    def predict_on_batch(self, x):
+        x = np.asarray(x, dtype=np.float32)
+        with self._lock:
+            if x.shape[0] != self._batch_size:
+                self.interpreter.resize_tensor_input(self.input["index"], list(x.shape))
+                self.interpreter.allocate_tensors()
+                self.input = self.interpreter.get_input_details()[0]
+                self.output = self.interpreter.get_output_details()[0]
+                self._batch_size = x.shape[0]
+            scale, zero_point = self.input["quantization"]
+            if self.input["dtype"] != np.float32 and scale:
+                info = np.iinfo(self.input["dtype"])
+                x = np.clip(np.round(x / scale + zero_point), info.min, info.max)
+            self.interpreter.set_tensor(self.input["index"], x.astype(self.input["dtype"]))
+            self.interpreter.invoke()
+            y = self.interpreter.get_tensor(self.output["index"])
+            scale, zero_point = self.output["quantization"]
+            if self.output["dtype"] != np.float32 and scale:
+                y = (y.astype(np.float32) - zero_point) * scale
+            return y
+
+
+class TracedModel:
+    """Runs a Keras model through a traced tf.function instead of Keras predict.
+
+    One concrete function is traced per batch-size bucket, each with a fixed
+    (bucket, 48, 48, 1) float32 input, plus one with an open batch dimension
+    for inputs larger than the biggest bucket. A batch is zero-padded up to the
+    nearest bucket, so serving never traces again and skips the Keras
+    callback and data-adapter machinery on every call. warmup() runs each
+    function once so the first real request does not pay for graph and
+    allocator setup.
+    """
+
+    def __init__(self, model, buckets):
+        tf = import_tensorflow()
+        self.model = model
+        self.buckets = sorted(set(max(1, int(b)) for b in buckets))
+        self.input_shape = tuple(int(d) for d in model.input_shape[1:])
+
+        @tf.function(autograph=False)
+        def forward(x):
+            return model(x, training=False)
+
+        self._functions = {
+            b: forward.get_concrete_function(tf.TensorSpec((b,) + self.input_shape, tf.float32))
+            for b in self.buckets}
+        self._any = forward.get_concrete_function(tf.TensorSpec((None,) + self.input_shape, tf.float32))
+
+    def bucket(self, n):
+        """Smallest bucket that holds n inputs, or None if n exceeds them all."""
+        for b in self.buckets:
+            if b >= n:
+                return b
+        return None
+
+    def predict_on_batch(self, x):
+        x = np.asarray(x, dtype=np.float32)
+        n = len(x)
+        b = self.bucket(n)
+        if b is None:
+            return self._any(x).numpy()
+        if b != n:
+            padded = np.zeros((b,) + x.shape[1:], dtype=np.float32)
+            padded[:n] = x
+            x = padded
+        return self._functions[b](x).numpy()[:n]
+
+    def warmup(self):
+        for b in self.buckets:
+            self._functions[b](np.zeros((b,) + self.input_shape, dtype=np.float32))
+        self._any(np.zeros((self.buckets[-1] + 1,) + self.input_shape, dtype=np.float32))
+
+
+def batch_buckets(spec=INFERENCE_BUCKETS, max_batch_size=None):
+    """Bucket sizes from a "1,4,16" style spec, or powers of two up to the batcher's batch size."""
+    if spec.strip():
+        return [int(b) for b in spec.split(",") if b.strip()]
+    max_batch_size = max_batch_size or INFERENCE_BATCH_SIZE
+    buckets = [1]
+    while buckets[-1] < max_batch_size:
+        buckets.append(min(buckets[-1] * 2, max_batch_size))
+    return buckets
+
+
+def model_file():
+    """Path of the model file the configured backend will load."""
+    return TFLITE_MODEL_PATH if INFERENCE_BACKEND == "tflite" else MODEL_PATH
+
+
+def warm_up(model):
+    """Run dummy batches through the model so tracing and allocation happen now."""
+    if hasattr(model, "warmup"):
+        model.warmup()
+    else:
+        for b in batch_buckets():
+            model.predict_on_batch(np.zeros((b, 48, 48, 1), dtype=np.float32))
+
+
+def get_model():
+    """Load and warm the model for INFERENCE_BACKEND on first use (once per process) and return it.
+
+    The model is only published once warm_up() has finished, so model_loaded()
+    (and the /ready probe) stay false until the first request can run at full speed.
+    """
+    global _model, _model_error, _warmup_seconds
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                try:
+                    started = time.perf_counter()
+                    if INFERENCE_BACKEND == "tflite":
+                        model = TFLiteModel(TFLITE_MODEL_PATH)
+                    elif INFERENCE_BACKEND == "keras":
+                        model = import_tensorflow().keras.models.load_model(MODEL_PATH)
+                        if INFERENCE_TRACED:
+                            model = TracedModel(model, batch_buckets())
+                    else:
+                        raise ValueError(f"Unknown INFERENCE_BACKEND {INFERENCE_BACKEND!r} (use keras or tflite)")
+                    warm_up(model)
+                    _warmup_seconds = time.perf_counter() - started
+                    _model_error = None
+                    _model = model
+                except Exception as e:
+                    _model_error = e
+                    raise
+    return _model
+
+
+def model_loaded():
+    return _model is not None
+
+
+def warmup_seconds():
+    return _warmup_seconds
+
+
+def model_error():
+    return _model_error
+
+
+def load_model_async():
+    """Start loading the model in a background thread unless it is already loaded or loading."""
+    if _model is not None or _model_lock.locked():
+        return
+
+    def load():
+        try:
+            get_model()
+        except Exception as e:
+            print(f"Warning: model load failed: {e}")
+
+    threading.Thread(target=load, name="model-loader", daemon=True).start()
+
+
+# Batching knobs: a batch is flushed once it holds INFERENCE_BATCH_SIZE faces
+# or INFERENCE_BATCH_WAIT_MS have passed since its first face arrived.
+INFERENCE_BATCH_SIZE = max(1, _env_int("INFERENCE_BATCH_SIZE", 16))
+INFERENCE_BATCH_WAIT_MS = max(0.0, _env_float("INFERENCE_BATCH_WAIT_MS", 5.0))
+
+INFERENCE_SECONDS = metrics.histogram(
+    "emotion_inference_seconds", "Time spent in one batched model forward pass.")
+INFERENCE_BATCH_SIZE_HIST = metrics.histogram(
+    "emotion_inference_batch_size", "Faces per batched forward pass.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+INFERENCE_QUEUE_SIZE = metrics.gauge(
+    "emotion_inference_queue_size", "Faces waiting for the inference batcher.")
+
+
+class InferenceBatcher:
+    """Collects preprocessed faces from request threads and runs them
+    through the model in one batched forward pass.
+
+    Faces arrive one at a time (submit) or as a ready-made (k, 48, 48, 1)
+    array (submit_batch), which joins the batch without being split or
+    re-stacked. `predict_fn` receives an array of shape (n, 48, 48, 1) and
+    must return one row of class probabilities per input.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=INFERENCE_BATCH_SIZE,
+                 max_wait_ms=INFERENCE_BATCH_WAIT_MS):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._thread = LazyThread(self._run, "inference-batcher", on_start=self._reset)
+        INFERENCE_QUEUE_SIZE.set_function(lambda: self._queue.qsize())
+
+    def _reset(self):
+        # Faces queued in the parent process have no worker to answer them here
+        self._queue = queue.Queue()
+
+    def submit(self, face):
+        """Queue one preprocessed face and return a Future for its probabilities."""
+        self._thread.ensure_started()
+        future = Future()
+        self._queue.put((face[np.newaxis], future, True))
+        return future
+
+    def submit_batch(self, faces):
+        """Queue a (k, 48, 48, 1) array and return a Future for its (k, classes) probabilities."""
+        future = Future()
+        if len(faces) == 0:
+            future.set_result(np.zeros((0, 0), dtype=np.float32))
+            return future
+        self._thread.ensure_started()
+        self._queue.put((faces, future, False))
+        return future
+
+    def predict_batch(self, faces, timeout=None):
+        """Blocking helper: probabilities for every face in a (k, 48, 48, 1) array."""
+        return self.submit_batch(faces).result(timeout=timeout)
+
+    def predict(self, face, timeout=None):
+        """Blocking helper: submit a face and wait for its probabilities."""
+        return self.submit(face).result(timeout=timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    # Deadline passed: still take whatever is already waiting
+                    item = self._queue.get_nowait()
+                else:
+                    item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    def _run(self):
+        while True:
+            # Skip callers that gave up (cancelled) before the batch ran
+            batch = [item for item in self._collect() if item[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            faces = batch[0][0] if len(batch) == 1 else np.concatenate([item[0] for item in batch])
+            INFERENCE_BATCH_SIZE_HIST.observe(len(faces))
+            try:
+                with INFERENCE_SECONDS.time():
+                    outputs = np.asarray(self.predict_fn(faces))
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            start = 0
+            for items, future, single in batch:
+                end = start + len(items)
+                future.set_result(outputs[start] if single else outputs[start:end])
+                start = end
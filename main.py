@@ -65,135 +65,447 @@
 
 # if __name__ == '__main__':
 #     app.run(debug=True)
-from flask import Flask, render_template, Response, jsonify
+from flask import Flask, render_template, Response, jsonify, request, g
 import cv2
 import numpy as np
-import tensorflow as tf
 import json
+import math
 import os
 import random
-import base64
+import time
+import threading
+import uuid
+from functools import lru_cache
+from inference import (InferenceBatcher, get_model, load_model_async, model_error,
+                       model_file, model_loaded, warmup_seconds)
+from capture import (CaptureThread, EncodedFrameCache, JPEG_QUALITY, encode_jpeg,
+                     multipart_chunk, resize_to_width)
+from face_tracking import FaceDetector, FaceTracker, FACE_MAX_FACES, crop_box
+from image_io import decode_grayscale
+from analysis import EmotionAnalyzer, ANALYSIS_FPS, describe_face
+from camera_source import CameraSupervisor, CAMERA_MAX_INDEX, discover_camera
+from snapshots import SnapshotStore, SNAPSHOT_REQUESTS, SNAPSHOT_TTL_SECONDS, THUMBNAIL_WIDTH
+from stress_history import SessionStore
+import metrics
 
 app = Flask(__name__)
 
-# Load ML Model (Local File)
-MODEL_PATH = "model/emotion_model.h5"
+# ML Model (Local File): checked now, but TensorFlow and the model load lazily on
+# first use so importing this module (e.g. in the gunicorn master) stays cheap
+if not os.path.exists(model_file()):
+    raise FileNotFoundError(f"Model file not found! Please check '{model_file()}'.")
 
-if not os.path.exists(MODEL_PATH):
-    raise FileNotFoundError("Model file not found! Please check 'model/emotion_model.h5'.")
-
-model = tf.keras.models.load_model(MODEL_PATH)
 emotion_labels = ["Angry", "Disgust", "Fear", "Happy", "Neutral", "Sad", "Surprise"]
 
+# Requests submit single faces; a worker thread runs them through the model in batches
+batcher = InferenceBatcher(lambda faces: get_model().predict_on_batch(faces))
+
+RANDOM_FALLBACKS = metrics.counter(
+    "emotion_random_fallbacks", "get_advice answers that used a random emotion, by reason.", ["reason"])
+ACTIVE_STREAMS = metrics.gauge("video_feed_active_streams", "Open /video_feed streams.")
+GET_ADVICE_SECONDS = metrics.histogram("get_advice_seconds", "Total /get_advice handling time.")
+
 # Load JSON Data
 with open("data.json", "r") as file:
     emotion_responses = json.load(file)
 
-# OpenCV for webcam: try multiple indices and use Windows DirectShow backend when available
-def find_camera(max_index=4):
+# OpenCV for webcam: indices are probed in parallel and the last working one is cached
+def find_camera(max_index=CAMERA_MAX_INDEX):
     """Try to find a working camera. Returns an opened VideoCapture or None.
-    On Windows, prefer DirectShow backend which is often more reliable for webcams.
+    Blocks for up to CAMERA_PROBE_TIMEOUT seconds; the app itself uses a
+    CameraSupervisor (see init_camera) so requests never wait on this.
     """
-    # If user provided a CAMERA_INDEX env var, try it first
-    env_index = None
-    try:
-        env_index = os.environ.get("CAMERA_INDEX")
-        if env_index is not None:
-            env_index = int(env_index)
-    except Exception:
-        env_index = None
-
-    tried = set()
+    cap, index, _ = discover_camera(max_index)
+    if cap is None:
+        print("Warning: No working camera found. The app will use a placeholder image and random emotions.")
+        return None
+    print(f"Using camera index {index}")
+    return cap
+
+
+# Camera state is set up per process on first use (see init_camera) so a preloading
+# gunicorn master never opens the device and hands the same handle to every worker
+CAMERA_BUFFER_SIZE = int(os.environ.get("CAMERA_BUFFER_SIZE", 4))
+camera = None
+capture = None
+analyzer = None
+_camera_pid = None
+_camera_lock = threading.Lock()
+
+# Each captured frame is JPEG-encoded once and reused by every stream and result page
+frame_cache = EncodedFrameCache(CAMERA_BUFFER_SIZE * 4)
+
+# Result images are served from /snapshot/<id>.jpg instead of being inlined in the page
+snapshot_store = SnapshotStore()
+
+# Locates the face so the model sees a FER-style crop instead of the whole room
+face_tracker = FaceTracker(max_faces=FACE_MAX_FACES)
+
+# Crop a grayscale image to the face box (if any) and scale it to the (48, 48, 1) float32
+# model input, written into `out` (e.g. one row of a preallocated batch) when given
+def to_model_input(gray, box=None, out=None):
+    if box is not None:
+        gray = crop_box(gray, box)
+    gray = cv2.resize(gray, (48, 48), interpolation=cv2.INTER_AREA)
+    if out is None:
+        out = np.empty((48, 48, 1), dtype=np.float32)
+    np.divide(gray, np.float32(255.0), out=out[..., 0], casting='unsafe')
+    return out
+
+# Crop every (gray, box) pair into one preallocated (K, 48, 48, 1) batch
+def to_model_batch(crops):
+    batch = np.empty((len(crops), 48, 48, 1), dtype=np.float32)
+    for i, (gray, box) in enumerate(crops):
+        to_model_input(gray, box, out=batch[i])
+    return batch
+
+# Turn a BGR frame into the (48, 48, 1) float32 input the model expects
+def preprocess_face(frame):
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return to_model_input(gray, face_tracker.update(gray))
 
-    if env_index is not None:
-        indices = [env_index] + [i for i in range(max_index + 1) if i != env_index]
-    else:
-        indices = list(range(max_index + 1))
+# Class probabilities for a frame, in emotion_labels order
+def predict_emotion(frame):
+    return batcher.predict(preprocess_face(frame))
 
-    for i in indices:
-        if i in tried:
+# Every tracked face in a frame as (box, probabilities), largest first, classified in
+# one forward pass; the whole frame stands in (box None) when no face is found
+def predict_faces(frame):
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    boxes = face_tracker.update_all(gray) or [None]
+    probabilities = batcher.predict_batch(to_model_batch([(gray, box) for box in boxes]))
+    return list(zip(boxes, probabilities))
+
+# Label each classified face on a copy of the frame
+def draw_faces(frame, faces):
+    frame = frame.copy()
+    for face in faces:
+        if face["box"] is None:
             continue
-        tried.add(i)
-        try:
-            # On Windows prefer DirectShow (CAP_DSHOW)
-            if os.name == 'nt':
-                cap = cv2.VideoCapture(i, cv2.CAP_DSHOW)
-            else:
-                cap = cv2.VideoCapture(i)
-
-            if cap is None:
-                continue
-
-            if cap.isOpened():
-                # quick frame read to ensure the camera can deliver frames
-                ret, frame = cap.read()
-                if ret:
-                    print(f"Using camera index {i}")
-                    return cap
-                cap.release()
-        except Exception:
-            # ignore and try next index
-            try:
-                cap.release()
-            except Exception:
-                pass
-
-    print("Warning: No working camera found. The app will use a placeholder image and random emotions.")
-    return None
-
-
-# initialize camera (may be None)
-camera = find_camera()
+        x, y, w, h = face["box"]
+        confidence = face["probabilities"][face["emotion"]]
+        cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+        cv2.putText(frame, f"{face['emotion']} {confidence:.0%}", (x, max(15, y - 8)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+    return frame
 
 # Function to detect emotion from frame
 def detect_emotion(frame):
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    gray = cv2.resize(gray, (48, 48))
-    gray = np.expand_dims(gray, axis=0).reshape(1, 48, 48, 1) / 255.0
-    prediction = model.predict(gray)
-    return emotion_labels[np.argmax(prediction)]
+    return emotion_labels[np.argmax(predict_emotion(frame))]
 
 # Function to get response from JSON file
 def get_solution(emotion):
     return emotion_responses.get(emotion, "No advice available for this emotion.")
 
+# Continuous analysis: classify sampled frames in the background and share the latest result
+ANALYSIS_MAX_AGE = float(os.environ.get("ANALYSIS_MAX_AGE", 2.0))
+
+def init_camera(cam=None):
+    """Set up capture and analysis for this process, using `cam` or a
+    CameraSupervisor that finds the camera in the background. Runs once per
+    process; later calls return immediately and never wait for a device."""
+    global camera, capture, analyzer, _camera_pid
+    if _camera_pid == os.getpid():
+        return
+    with _camera_lock:
+        if _camera_pid == os.getpid():
+            return
+        # Discovery and reconnects happen on the supervisor's own thread
+        camera = cam if cam is not None else CameraSupervisor()
+        # One background thread reads the camera into a ring buffer shared by every client
+        capture = CaptureThread(camera, CAMERA_BUFFER_SIZE) if camera is not None else None
+        if capture is not None and ANALYSIS_FPS > 0:
+            analyzer = EmotionAnalyzer(capture, predict_faces, emotion_labels, advice_fn=get_solution)
+        else:
+            analyzer = None
+        _camera_pid = os.getpid()
+
+# False while the supervisor has no device open (never found, or unplugged)
+def camera_connected():
+    return capture is not None and getattr(camera, "connected", True)
+
+# Latest background result if it is recent enough to stand in for a fresh prediction
+def latest_analysis():
+    init_camera()
+    if analyzer is None:
+        return None
+    result = analyzer.latest()
+    if result is None or time.time() - result["timestamp"] > ANALYSIS_MAX_AGE:
+        return None
+    return result
+
+# Stream pacing: clients get at most STREAM_MAX_FPS frames per second; placeholders
+# never change, so they are re-sent only every PLACEHOLDER_INTERVAL seconds
+STREAM_MAX_FPS = float(os.environ.get("STREAM_MAX_FPS", 15))
+PLACEHOLDER_INTERVAL = float(os.environ.get("PLACEHOLDER_INTERVAL", 1.0))
+# Clients may ask for one of these widths; snapping keeps the encoded-frame cache shared
+STREAM_WIDTHS = (160, 320, 480, 640)
+
+# Placeholder frames are rendered and encoded once per (message, size, quality)
+@lru_cache(maxsize=32)
+def placeholder_chunk(message, width=None, quality=JPEG_QUALITY):
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    cv2.putText(frame, message, (50, 240),
+               cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+    cv2.putText(frame, "Using fallback - random emotions", (50, 280),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+    return multipart_chunk(encode_jpeg(resize_to_width(frame, width), quality))
+
+# Read ?fps=, ?width= and ?quality= for a stream, clamped and snapped to supported values
+def stream_options(args):
+    try:
+        fps = float(args.get("fps", STREAM_MAX_FPS))
+    except ValueError:
+        fps = STREAM_MAX_FPS
+    if not math.isfinite(fps):
+        fps = STREAM_MAX_FPS
+    fps = min(max(fps, 0.5), STREAM_MAX_FPS)
+
+    width = args.get("width", type=int)
+    if width is not None:
+        width = min(STREAM_WIDTHS, key=lambda w: abs(w - width))
+
+    quality = args.get("quality", JPEG_QUALITY, type=int)
+    quality = min(max(5 * round(quality / 5), 20), 95)
+    return fps, width, quality
+
 # Video feed route
-def generate_frames():
+def generate_frames(fps=STREAM_MAX_FPS, width=None, quality=JPEG_QUALITY):
+    init_camera()
+    ACTIVE_STREAMS.inc()
+    try:
+        yield from _frames(fps, width, quality)
+    finally:
+        # Runs when the client disconnects and the response closes the generator
+        ACTIVE_STREAMS.dec()
+
+def _frames(fps, width, quality):
+    period = 1.0 / fps
+    last_seq = 0
     while True:
+        started = time.monotonic()
         # If camera not available, yield a placeholder frame
-        if camera is None:
-            frame = np.zeros((480, 640, 3), dtype=np.uint8)
-            cv2.putText(frame, "Camera not available", (50, 240),
-                       cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-            cv2.putText(frame, "Using fallback - random emotions", (50, 280),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+        if capture is None:
+            chunk, interval = placeholder_chunk("Camera not available", width, quality), PLACEHOLDER_INTERVAL
         else:
-            success, frame = camera.read()
-            if not success or frame is None:
+            # Wait for a frame this client has not sent yet. A slow client simply gets
+            # the newest frame when it is ready again; frames in between are skipped.
+            last_seq, frame = capture.wait_next(last_seq)
+            if frame is not None:
+                chunk, interval = frame_cache.get(last_seq, frame, quality, width).chunk, period
+            else:
                 # Show a friendly placeholder instead of breaking the stream
-                frame = np.zeros((480, 640, 3), dtype=np.uint8)
-                cv2.putText(frame, "Camera read failed", (50, 240),
-                           cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-                cv2.putText(frame, "Using fallback - random emotions", (50, 280),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+                message = "Camera read failed" if camera_connected() else "Camera not available"
+                chunk, interval = placeholder_chunk(message, width, quality), PLACEHOLDER_INTERVAL
 
-        _, buffer = cv2.imencode('.jpg', frame)
-        frame_bytes = buffer.tobytes()
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+        yield chunk
+        remaining = interval - (time.monotonic() - started)
+        if remaining > 0:
+            time.sleep(remaining)
 
 @app.route('/video_feed')
 def video_feed():
-    return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    fps, width, quality = stream_options(request.args)
+    return Response(generate_frames(fps, width, quality),
+                    mimetype='multipart/x-mixed-replace; boundary=frame')
+
+# Per-session stress history: each browser gets a cookie, and every result shown to it
+# (advice page, live events, /api/latest) is recorded in that session's ring buffers,
+# kept in files shared by all worker processes
+SESSION_COOKIE = "stress_session"
+sessions = SessionStore(emotion_labels)
+
+def valid_session_id(session_id):
+    return bool(session_id) and len(session_id) <= 64 and session_id.isalnum()
+
+def session_history():
+    session_id = request.cookies.get(SESSION_COOKIE) or request.args.get("session")
+    if not valid_session_id(session_id):
+        session_id = g.new_session_id = uuid.uuid4().hex
+    return sessions.get(session_id)
+
+def record_result(history, result):
+    probabilities = [result["probabilities"][label] for label in emotion_labels]
+    history.push(result["timestamp"], probabilities)
+
+@app.after_request
+def set_session_cookie(response):
+    session_id = g.get("new_session_id")
+    if session_id is not None:
+        response.set_cookie(SESSION_COOKIE, session_id, max_age=30 * 24 * 3600, httponly=True, samesite="Lax")
+    return response
+
+@app.route('/api/history')
+def api_history():
+    history = session_history()
+    seconds = request.args.get("seconds", type=float)
+    if seconds is not None and not math.isfinite(seconds):
+        seconds = None
+    points = min(max(1, request.args.get("points", 60, type=int)), history.num_buckets)
+    return jsonify({
+        "labels": emotion_labels,
+        "rolling": history.rolling(),
+        "history": history.history(seconds, points),
+    })
+
+@app.route('/events')
+def events():
+    init_camera()
+    if analyzer is None:
+        return jsonify({"error": "Live analysis not available"}), 503
+    history = session_history()
+
+    def stream():
+        version = 0
+        while True:
+            new_version, result, event = analyzer.wait_next(version)
+            if new_version == version or event is None:
+                yield ": keepalive\n\n"
+            else:
+                version = new_version
+                record_result(history, result)
+                yield event
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/latest')
+def api_latest():
+    init_camera()
+    if analyzer is None:
+        return jsonify({"error": "Live analysis not available"}), 503
+    result = analyzer.latest()
+    if result is None:
+        return jsonify({"error": "No analysis result yet"}), 503
+    if time.time() - result["timestamp"] > ANALYSIS_MAX_AGE:
+        # The loop idled; latest() has woken it, so a later poll gets a fresh result
+        return jsonify({"error": "No recent analysis result"}), 503
+    record_result(session_history(), result)
+    return jsonify(result)
+
+# Uploaded images are unrelated to each other, so they use plain detection rather than the tracker
+API_MAX_IMAGES = int(os.environ.get("API_MAX_IMAGES", 32))
+app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get("API_MAX_UPLOAD_MB", 16)) * 1024 * 1024
+_upload_detector = None
+_upload_detector_lock = threading.Lock()
+
+def detect_upload_faces(gray):
+    global _upload_detector
+    with _upload_detector_lock:
+        if _upload_detector is None:
+            _upload_detector = FaceDetector()
+        faces = _upload_detector.detect(gray)
+    return faces[:FACE_MAX_FACES]
+
+@app.route('/api/predict', methods=['POST'])
+def api_predict():
+    # Many images as multipart files (any field name), or one image as the raw request body
+    if request.files:
+        blobs = [f.read() for key in request.files for f in request.files.getlist(key)]
+    else:
+        blobs = [request.get_data(cache=False)]
+    blobs = [data for data in blobs if data]
+    if not blobs:
+        return jsonify({"error": "No image data received"}), 400
+    if len(blobs) > API_MAX_IMAGES:
+        return jsonify({"error": f"At most {API_MAX_IMAGES} images per request"}), 413
+
+    detect = request.args.get("detect", "1") != "0"
+    results = [None] * len(blobs)
+    crops, slots = [], []
+    for i, data in enumerate(blobs):
+        gray, scale = decode_grayscale(data)
+        if gray is None:
+            results[i] = {"error": "Could not decode image"}
+            continue
+        # Every face in the image (or the whole image when none is found) gets a row
+        for box in (detect_upload_faces(gray) if detect else []) or [None]:
+            crops.append((gray, box))
+            slots.append((i, box, scale))
+
+    if crops:
+        try:
+            # All faces of all images go through the model as one batch
+            predictions = batcher.predict_batch(to_model_batch(crops))
+        except Exception as e:
+            print(f"Warning: detection failed: {e}")
+            return jsonify({"error": "Prediction failed"}), 500
+        for (i, box, scale), probabilities in zip(slots, predictions):
+            face = {
+                "emotion": emotion_labels[int(np.argmax(probabilities))],
+                "probabilities": [round(float(p), 4) for p in probabilities],
+                "box": [int(round(v * scale)) for v in box] if box is not None else None,
+            }
+            if results[i] is None:
+                # Top-level fields describe the largest face, as for single-face images
+                results[i] = dict(face, faces=[])
+            results[i]["faces"].append(face)
+
+    return jsonify({"labels": emotion_labels, "results": results})
 
 @app.route('/')
 def index():
+    session_history()  # hand out the session cookie before the page opens /events
     return render_template('index.html')
 
+@app.route('/ready')
+def ready():
+    # Readiness probe: kicks off the lazy model load and reports 200 once the
+    # model is loaded and warmed up
+    load_model_async()
+    error = model_error()
+    status = {
+        "ready": model_loaded(),
+        "model_loaded": model_loaded(),
+        "warmup_seconds": warmup_seconds(),
+        "camera": None if _camera_pid != os.getpid() else camera_connected(),
+    }
+    if error is not None:
+        status["error"] = str(error)
+    return jsonify(status), 200 if status["ready"] else 503
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/snapshot/<snapshot_id>.jpg')
+def snapshot(snapshot_id):
+    entry = snapshot_store.get(snapshot_id)
+    if entry is None:
+        SNAPSHOT_REQUESTS.labels("missing").inc()
+        return jsonify({"error": "Snapshot expired or unknown"}), 404
+    thumbnail = request.args.get('size') == 'thumb'
+    # Snapshot bytes never change for an id, so the id is a strong ETag
+    etag = entry.id + ("-thumb" if thumbnail else "")
+    if request.if_none_match.contains(etag):
+        SNAPSHOT_REQUESTS.labels("not_modified").inc()
+        response = Response(status=304)
+    else:
+        try:
+            data = entry.thumbnail() if thumbnail else entry.jpeg
+        except FileNotFoundError:
+            # Pruned by another worker since get()
+            SNAPSHOT_REQUESTS.labels("missing").inc()
+            return jsonify({"error": "Snapshot expired or unknown"}), 404
+        SNAPSHOT_REQUESTS.labels("thumbnail" if thumbnail else "full").inc()
+        response = Response(data, mimetype='image/jpeg')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'private, max-age={int(SNAPSHOT_TTL_SECONDS)}, immutable'
+    return response
+
 @app.route('/get_advice')
 def get_advice():
+    with GET_ADVICE_SECONDS.time():
+        return _get_advice()
+
+def _get_advice():
+    init_camera()
     # Handle missing camera or failed reads gracefully
-    if camera is None:
+    frame_seq = None
+    faces = []
+    rolling = None
+    if capture is None:
+        RANDOM_FALLBACKS.labels("no_camera").inc()
         emotion = random.choice(emotion_labels)
         advice = get_solution(emotion)
         # create placeholder frame
@@ -203,33 +515,56 @@ def get_advice():
         cv2.putText(frame, f"DETECTED: {emotion}", (50, 260),
                    cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
     else:
-        success, frame = camera.read()
-        if not success or frame is None:
+        # Newest buffered frame; only waits if the camera is up but nothing has been captured yet
+        seq, frame = capture.wait_next(0) if camera_connected() else capture.latest()
+        if frame is None:
             # fallback to placeholder and random emotion
+            connected = camera_connected()
+            RANDOM_FALLBACKS.labels("read_failed" if connected else "no_camera").inc()
             emotion = random.choice(emotion_labels)
             advice = get_solution(emotion)
             frame = np.zeros((480, 640, 3), dtype=np.uint8)
-            cv2.putText(frame, "Camera read failed", (50, 200),
+            cv2.putText(frame, "Camera read failed" if connected else "Camera not available", (50, 200),
                        cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
             cv2.putText(frame, f"DETECTED: {emotion}", (50, 260),
                        cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
         else:
+            frame_seq = seq
             # Try running the real detection but fall back on error
             try:
-                emotion = detect_emotion(frame)
-                advice = get_solution(emotion)
+                # Reuse the background result when it is fresh instead of predicting again
+                result = latest_analysis()
+                if result is None:
+                    faces = [describe_face(box, p, emotion_labels) for box, p in predict_faces(frame)]
+                    result = {"timestamp": time.time(), "probabilities": faces[0]["probabilities"]}
+                faces = result.get("faces", faces)
+                emotion = faces[0]["emotion"]
+                # Advice follows the session's recent readings rather than this one frame
+                history = session_history()
+                record_result(history, result)
+                rolling = history.rolling()
+                advice = get_solution(rolling["emotion"])
             except Exception as e:
                 print(f"Warning: detection failed: {e}")
+                RANDOM_FALLBACKS.labels("detection_error").inc()
                 emotion = random.choice(emotion_labels)
                 advice = get_solution(emotion)
 
-    # Encode image as base64 for the template
-    _, buffer = cv2.imencode('.jpg', frame)
-    img_data = base64.b64encode(buffer).decode('utf-8')
+    # Store the image for /snapshot, reusing the stream's JPEG when there is nothing to draw
+    if any(face["box"] is not None for face in faces):
+        jpeg = encode_jpeg(draw_faces(frame, faces))
+    elif frame_seq is not None:
+        jpeg = frame_cache.get(frame_seq, frame).jpeg
+    else:
+        jpeg = encode_jpeg(frame)
+    snapshot_id = snapshot_store.put(jpeg)
 
-    return render_template("result.html", emotion=emotion, advice=advice, img_data=img_data)
+    return render_template("result.html", emotion=emotion, advice=advice, faces=faces, rolling=rolling,
+                           img_url=f"/snapshot/{snapshot_id}.jpg", img_width=frame.shape[1],
+                           thumb_url=f"/snapshot/{snapshot_id}.jpg?size=thumb", thumb_width=THUMBNAIL_WIDTH)
 
 # ✅ Flask Port Handling for Railway Deployment
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 5000))
+    load_model_async()
     app.run(host="0.0.0.0", port=port)
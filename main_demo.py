@@ -5,6 +5,7 @@ import json
 import os
 import random
 import base64
+from camera_source import CameraSupervisor
 
 app = Flask(__name__)
 
@@ -15,29 +16,12 @@ emotion_labels = ["Angry", "Disgust", "Fear", "Happy", "Neutral", "Sad", "Surpri
 with open("data.json", "r") as file:
     emotion_responses = json.load(file)
 
-# Global camera variable
-camera = None
+# Global camera: found (and re-found after unplugging) in the background
+camera = CameraSupervisor()
 
 def get_camera():
-    """Get camera instance with error handling"""
-    global camera
-    if camera is None or not camera.isOpened():
-        try:
-            camera = cv2.VideoCapture(0)
-            if not camera.isOpened():
-                # Try different camera indices
-                for i in range(1, 5):
-                    camera = cv2.VideoCapture(i)
-                    if camera.isOpened():
-                        print(f"Camera found at index {i}")
-                        break
-                else:
-                    print("No camera found")
-                    return None
-        except Exception as e:
-            print(f"Camera error: {e}")
-            return None
-    return camera
+    """Get the camera if one is connected; never waits for discovery"""
+    return camera if camera.start().connected else None
 
 # Demo function to simulate emotion detection
 def detect_emotion_demo(frame):
@@ -0,0 +1,224 @@
+"""
+Minimal Prometheus-style metrics (counters, gauges, histograms).
+
+Recording is lock-free: every thread writes into its own shard of the values
+and shards are only summed when /metrics is scraped. Metrics are per process,
+so under gunicorn each worker reports its own numbers.
+"""
+
+import bisect
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+class _ShardOwner:
+    """Kept only in a thread's local storage, so it dies with the thread."""
+
+    __slots__ = ("shard", "__weakref__")
+
+    def __init__(self, shard):
+        self.shard = shard
+
+
+class _Shards:
+    """Per-thread lists of floats that are summed column-wise on read.
+
+    When a thread exits its shard is folded into a retired total, so threads
+    started per request (the Werkzeug dev server) do not pile up shards.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._local = threading.local()
+        self._shards = []
+        self._retired = [0.0] * size
+        # Reentrant: a finalizer can run from garbage collection inside totals()
+        self._lock = threading.RLock()
+
+    def mine(self):
+        owner = getattr(self._local, "owner", None)
+        if owner is None:
+            owner = self._local.owner = _ShardOwner([0.0] * self.size)
+            with self._lock:  # only once per thread
+                self._shards.append(owner.shard)
+            weakref.finalize(owner, self._retire, owner.shard)
+        return owner.shard
+
+    def _retire(self, shard):
+        with self._lock:
+            self._shards = [s for s in self._shards if s is not shard]
+            self._retired = [a + b for a, b in zip(self._retired, shard)]
+
+    def totals(self):
+        with self._lock:
+            return [sum(column) for column in zip(self._retired, *self._shards)]
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """Child metric for one combination of label values."""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _samples(self):
+        if not self.labelnames:
+            yield from self._child_samples(self, "")
+            return
+        for key, child in sorted(self._children.items()):
+            labels = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(self.labelnames, key))
+            yield from self._child_samples(child, labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._shards = _Shards(1)
+
+    def _new_child(self):
+        return Counter(self.name, self.help)
+
+    def inc(self, amount=1):
+        self._shards.mine()[0] += amount
+
+    def value(self):
+        return self._shards.totals()[0]
+
+    def _child_samples(self, child, labels):
+        yield f"{self.name}_total{_braces(labels)} {_format(child.value())}"
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._shards = _Shards(1)
+        self._function = None
+
+    def _new_child(self):
+        return Gauge(self.name, self.help)
+
+    def inc(self, amount=1):
+        self._shards.mine()[0] += amount
+
+    def dec(self, amount=1):
+        self._shards.mine()[0] -= amount
+
+    def set_function(self, function):
+        """Read the value from function() at scrape time instead of tracking it."""
+        self._function = function
+
+    def value(self):
+        if self._function is not None:
+            return float(self._function())
+        return self._shards.totals()[0]
+
+    def _child_samples(self, child, labels):
+        yield f"{self.name}{_braces(labels)} {_format(child.value())}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # one slot per bucket, one for +Inf, then sum and count
+        self._shards = _Shards(len(self.buckets) + 3)
+
+    def _new_child(self):
+        return Histogram(self.name, self.help, buckets=self.buckets)
+
+    def observe(self, value):
+        shard = self._shards.mine()
+        shard[bisect.bisect_left(self.buckets, value)] += 1
+        shard[-2] += value
+        shard[-1] += 1
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def _child_samples(self, child, labels):
+        totals = child._shards.totals()
+        prefix = labels + "," if labels else ""
+        cumulative = 0.0
+        for bound, count in zip(self.buckets + (float("inf"),), totals):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else _format(bound)
+            yield f'{self.name}_bucket{{{prefix}le="{le}"}} {_format(cumulative)}'
+        yield f"{self.name}_sum{_braces(labels)} {_format(totals[-2])}"
+        yield f"{self.name}_count{_braces(labels)} {_format(totals[-1])}"
+
+
+def _register(metric):
+    with _registry_lock:
+        for existing in _registry:
+            if existing.name == metric.name:
+                return existing
+        _registry.append(metric)
+    return metric
+
+
+def counter(name, help, labelnames=()):
+    return _register(Counter(name, help, labelnames))
+
+
+def gauge(name, help, labelnames=()):
+    return _register(Gauge(name, help, labelnames))
+
+
+def histogram(name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return _register(Histogram(name, help, labelnames, buckets))
+
+
+def render():
+    """All registered metrics in the Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = list(_registry)
+    return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+def _braces(labels):
+    return "{" + labels + "}" if labels else ""
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(value):
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
@@ -0,0 +1,156 @@
+"""
+Offline batch inference over a directory of images.
+
+Scans a tree laid out like dataset/test/<class>/*.jpg, decodes images in a
+process pool and runs them through the model in large batches. Writes one
+row per image to predictions.csv and the accuracy plus confusion matrix to
+summary.json. Images whose folder is not an emotion name are predicted but
+not scored.
+
+Usage:
+    python model/batch_predict.py dataset/test
+    python model/batch_predict.py dataset/test --workers 8 --batch-size 512 --output-dir predictions
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from pack_dataset import IMAGE_EXTENSIONS, IMAGE_SIZE, load_image
+
+MODEL_PATH = "model/emotion_model.h5"
+emotion_labels = ["Angry", "Disgust", "Fear", "Happy", "Neutral", "Sad", "Surprise"]
+
+
+def scan_images(root):
+    """Return (paths, true label index or -1) for every image under root."""
+    label_index = {label.lower(): i for i, label in enumerate(emotion_labels)}
+    paths, labels = [], []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        label = label_index.get(os.path.basename(dirpath).lower(), -1)
+        for fname in sorted(filenames):
+            if fname.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(dirpath, fname))
+                labels.append(label)
+    return paths, np.asarray(labels, dtype=np.int64)
+
+
+def decode_chunk(paths):
+    """Decode a list of images into one uint8 array; unreadable files come back
+    as zeros with ok=False. Runs inside worker processes."""
+    images = np.zeros((len(paths), IMAGE_SIZE, IMAGE_SIZE), dtype=np.uint8)
+    ok = np.ones(len(paths), dtype=bool)
+    for i, path in enumerate(paths):
+        try:
+            images[i] = load_image(path)
+        except Exception:
+            ok[i] = False
+    return images, ok
+
+
+def iter_batches(paths, batch_size, workers, chunk_size=256):
+    """Yield (start index, uint8 images, ok mask) batches decoded by a process pool.
+
+    Later chunks keep decoding in the pool while the model runs on the
+    current batch.
+    """
+    chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+    pending_images, pending_ok, start = [], [], 0
+    # spawn keeps TensorFlow (already loaded in this process) out of the workers
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        for images, ok in pool.map(decode_chunk, chunks):
+            pending_images.append(images)
+            pending_ok.append(ok)
+            while sum(len(x) for x in pending_images) >= batch_size:
+                images, ok = np.concatenate(pending_images), np.concatenate(pending_ok)
+                yield start, images[:batch_size], ok[:batch_size]
+                start += batch_size
+                pending_images, pending_ok = [images[batch_size:]], [ok[batch_size:]]
+    if pending_images and sum(len(x) for x in pending_images):
+        yield start, np.concatenate(pending_images), np.concatenate(pending_ok)
+
+
+def confusion_matrix(true, predicted, num_classes):
+    matrix = np.zeros((num_classes, num_classes), dtype=np.int64)
+    np.add.at(matrix, (true, predicted), 1)
+    return matrix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a directory of images with the emotion model.")
+    parser.add_argument("directory", help="image tree, e.g. dataset/test")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="decode processes")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--output-dir", default="predictions")
+    args = parser.parse_args()
+
+    paths, labels = scan_images(args.directory)
+    if not paths:
+        raise SystemExit(f"No images found under {args.directory}")
+
+    import tensorflow as tf
+    model = tf.keras.models.load_model(args.model)
+
+    probabilities = np.zeros((len(paths), len(emotion_labels)), dtype=np.float32)
+    readable = np.zeros(len(paths), dtype=bool)
+    started = time.perf_counter()
+    for start, images, ok in iter_batches(paths, args.batch_size, args.workers):
+        batch = images[..., np.newaxis].astype(np.float32) / 255.0
+        probabilities[start:start + len(batch)] = np.asarray(model.predict_on_batch(batch))
+        readable[start:start + len(batch)] = ok
+    elapsed = time.perf_counter() - started
+    predicted = probabilities.argmax(axis=1)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    predictions_path = os.path.join(args.output_dir, "predictions.csv")
+    with open(predictions_path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["path", "label", "predicted", "confidence"] + emotion_labels)
+        for i, path in enumerate(paths):
+            if not readable[i]:
+                writer.writerow([path, "", "ERROR", ""] + [""] * len(emotion_labels))
+                continue
+            label = emotion_labels[labels[i]] if labels[i] >= 0 else ""
+            writer.writerow([path, label, emotion_labels[predicted[i]], f"{probabilities[i, predicted[i]]:.4f}"]
+                            + [f"{p:.4f}" for p in probabilities[i]])
+
+    scored = readable & (labels >= 0)
+    matrix = confusion_matrix(labels[scored], predicted[scored], len(emotion_labels))
+    accuracy = float(np.trace(matrix) / max(1, matrix.sum()))
+    summary = {
+        "directory": args.directory,
+        "model": args.model,
+        "images": len(paths),
+        "unreadable": int((~readable).sum()),
+        "scored": int(scored.sum()),
+        "accuracy": accuracy,
+        "labels": emotion_labels,
+        "confusion_matrix": matrix.tolist(),
+        "seconds": elapsed,
+        "images_per_second": len(paths) / elapsed if elapsed > 0 else None,
+        "workers": args.workers,
+        "batch_size": args.batch_size,
+    }
+    with open(os.path.join(args.output_dir, "summary.json"), "w") as file:
+        json.dump(summary, file, indent=2)
+
+    print(f"Scored {summary['scored']} of {len(paths)} images in {elapsed:.2f}s "
+          f"({summary['images_per_second']:.1f} images/sec)")
+    print(f"Accuracy: {accuracy:.4f}")
+    print("Confusion matrix (rows = true, columns = predicted):")
+    print(" " * 10 + "".join(f"{label[:8]:>9}" for label in emotion_labels))
+    for label, row in zip(emotion_labels, matrix):
+        print(f"{label:<10}" + "".join(f"{count:>9}" for count in row))
+    print(f"Predictions written to {predictions_path}")
+
+
+if __name__ == "__main__":
+    main()
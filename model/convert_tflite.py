@@ -0,0 +1,129 @@
+"""
+Convert model/emotion_model.h5 to TFLite (float16 and int8) and report the
+accuracy change on dataset/test.
+
+The int8 model uses post-training full-integer quantization, calibrated on a
+random sample of dataset/train. Serve a converted model with:
+    INFERENCE_BACKEND=tflite TFLITE_MODEL_PATH=model/emotion_model_int8.tflite python main.py
+
+Usage:
+    python model/convert_tflite.py
+    python model/convert_tflite.py --calibration-samples 1000 --types int8
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from pack_dataset import ensure_packed
+
+# The serving-side TFLiteModel lives in inference.py at the repo root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODEL_PATH = "model/emotion_model.h5"
+
+
+def convert(model, kind, calibration_images=None):
+    """Return TFLite flatbuffer bytes for kind "float32", "float16" or "int8"."""
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if kind == "float16":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif kind == "int8":
+        def representative_dataset():
+            for image in calibration_images:
+                yield [image[np.newaxis, ..., np.newaxis].astype(np.float32) / 255.0]
+
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+    return converter.convert()
+
+
+def tflite_predict(model_path, images, batch_size=256):
+    """Probabilities for uint8 (N, 48, 48) images using inference.TFLiteModel."""
+    from inference import TFLiteModel
+    model = TFLiteModel(model_path)
+    outputs = []
+    for start in range(0, len(images), batch_size):
+        batch = images[start:start + batch_size][..., np.newaxis].astype(np.float32) / 255.0
+        outputs.append(model.predict_on_batch(batch))
+    return np.concatenate(outputs)
+
+
+def keras_predict(model, images, batch_size=256):
+    outputs = []
+    for start in range(0, len(images), batch_size):
+        batch = images[start:start + batch_size][..., np.newaxis].astype(np.float32) / 255.0
+        outputs.append(np.asarray(model.predict_on_batch(batch)))
+    return np.concatenate(outputs)
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the emotion model to TFLite and compare accuracy.")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--types", nargs="+", choices=["float32", "float16", "int8"], default=["float16", "int8"])
+    parser.add_argument("--calibration-samples", type=int, default=500)
+    parser.add_argument("--output-dir", default="model")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    model = tf.keras.models.load_model(args.model)
+    train_images, _, _ = ensure_packed("train")
+    test_images, test_labels, _ = ensure_packed("test")
+    test_images = np.asarray(test_images)
+
+    rng = np.random.default_rng(args.seed)
+    sample = rng.choice(len(train_images), min(args.calibration_samples, len(train_images)), replace=False)
+    calibration_images = np.asarray(train_images[np.sort(sample)])
+
+    probabilities, seconds = timed(keras_predict, model, test_images)
+    baseline = float((probabilities.argmax(axis=1) == test_labels).mean())
+    report = {
+        "keras": {
+            "path": args.model,
+            "size_bytes": os.path.getsize(args.model),
+            "accuracy": baseline,
+            "ms_per_image": seconds / len(test_images) * 1000,
+        }
+    }
+    print(f"keras    accuracy {baseline:.4f}  ({report['keras']['size_bytes'] / 1024:.0f} KB)")
+
+    base_name = os.path.splitext(os.path.basename(args.model))[0]
+    for kind in args.types:
+        path = os.path.join(args.output_dir, f"{base_name}_{kind}.tflite")
+        with open(path, "wb") as file:
+            file.write(convert(model, kind, calibration_images))
+        probabilities, seconds = timed(tflite_predict, path, test_images)
+        accuracy = float((probabilities.argmax(axis=1) == test_labels).mean())
+        report[kind] = {
+            "path": path,
+            "size_bytes": os.path.getsize(path),
+            "accuracy": accuracy,
+            "accuracy_delta": accuracy - baseline,
+            "ms_per_image": seconds / len(test_images) * 1000,
+        }
+        print(f"{kind:<8} accuracy {accuracy:.4f}  delta {accuracy - baseline:+.4f}  "
+              f"({report[kind]['size_bytes'] / 1024:.0f} KB) -> {path}")
+
+    report_path = os.path.join(args.output_dir, f"{base_name}_tflite_report.json")
+    with open(report_path, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Report written to {report_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+tf.data input pipeline for training on dataset/<split>/<class>/*.jpg.
+
+Images are decoded in parallel, cached as uint8 (in memory, or on disk when a
+cache path is given), shuffled, batched and prefetched. Rescaling, one-hot
+labels and optional augmentation run once per batch rather than per image.
+The train/validation split is the same one flow_from_directory produces for
+validation_split (see pack_dataset.validation_split_indices).
+"""
+
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from pack_dataset import IMAGE_SIZE, list_images, validation_split_indices
+
+AUTOTUNE = tf.data.AUTOTUNE
+
+
+def _decode(path, label):
+    image = tf.io.decode_image(tf.io.read_file(path), channels=1, expand_animations=False)
+    # Nearest-neighbour keeps uint8; FER images are already 48x48 so this is a no-op
+    image = tf.image.resize(image, (IMAGE_SIZE, IMAGE_SIZE), method="nearest")
+    image.set_shape((IMAGE_SIZE, IMAGE_SIZE, 1))
+    return image, label
+
+
+def _augment_batch(images):
+    """Random horizontal flips and brightness shifts for a whole batch at once."""
+    n = tf.shape(images)[0]
+    flip = tf.random.uniform((n, 1, 1, 1)) < 0.5
+    images = tf.where(flip, tf.reverse(images, axis=[2]), images)
+    images = images + tf.random.uniform((n, 1, 1, 1), -0.1, 0.1)
+    return tf.clip_by_value(images, 0.0, 1.0)
+
+
+def build_dataset(paths, labels, num_classes, batch_size=64, training=False, cache="",
+                  augment=False, seed=None):
+    """Batched (images, one-hot labels) dataset over the given files.
+
+    cache="" keeps decoded images in memory; any other string is used as an
+    on-disk cache file prefix; None disables caching.
+    """
+    ds = tf.data.Dataset.from_tensor_slices((list(paths), np.asarray(labels, dtype=np.int32)))
+    ds = ds.map(_decode, num_parallel_calls=AUTOTUNE)
+    if cache is not None:
+        if cache:
+            os.makedirs(os.path.dirname(cache) or ".", exist_ok=True)
+        ds = ds.cache(cache)
+    if training:
+        ds = ds.shuffle(len(paths), seed=seed, reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size)
+
+    def prepare(images, batch_labels):
+        images = tf.cast(images, tf.float32) / 255.0
+        if training and augment:
+            images = _augment_batch(images)
+        return images, tf.one_hot(batch_labels, num_classes)
+
+    ds = ds.map(prepare, num_parallel_calls=AUTOTUNE)
+    return ds.prefetch(AUTOTUNE)
+
+
+def train_val_datasets(dataset_dir="dataset/train", batch_size=64, validation_split=0.2,
+                       cache="", augment=False, seed=None):
+    """Return (train_ds, val_ds, classes) for a class-per-folder directory."""
+    classes, files, labels = list_images(dataset_dir)
+    files, labels = np.asarray(files), np.asarray(labels)
+    train_idx, val_idx = validation_split_indices(labels, validation_split)
+
+    def cache_for(subset):
+        return cache if not cache else f"{cache}_{subset}"
+
+    train_ds = build_dataset(files[train_idx], labels[train_idx], len(classes), batch_size,
+                             training=True, cache=cache_for("train"), augment=augment, seed=seed)
+    val_ds = build_dataset(files[val_idx], labels[val_idx], len(classes), batch_size,
+                           training=False, cache=cache_for("val"))
+    print(f"Found {len(train_idx)} training and {len(val_idx)} validation images "
+          f"belonging to {len(classes)} classes (tf.data).")
+    return train_ds, val_ds, classes
@@ -0,0 +1,415 @@
+"""
+Pack dataset/<split>/<class>/*.jpg into contiguous uint8 arrays.
+
+Each split is written to dataset/packed/<split>/ as:
+    images.npy    (N, 48, 48) uint8, loadable as a memmap
+    labels.npy    (N,) uint8 class indices
+    classes.json  class names (index order) and the file count
+    manifest.json one entry per file: path, split, label, size, mtime,
+                  content hash, perceptual hash and row in images.npy
+
+Images are stored in the same order flow_from_directory uses (classes and
+files sorted by name), so validation splits match the generator's.
+
+Packing is incremental: files whose size and mtime match the manifest are
+not read again, and files whose content hash is already packed (unchanged,
+touched, renamed or moved between classes) are copied from the old arrays.
+Only new content is decoded.
+
+--leaks compares the train and test manifests and lists test images that
+also appear in train, byte for byte or as near-duplicates: pairs whose
+difference hashes are within --max-distance bits and whose packed pixels
+correlate at --min-correlation or more.
+
+Usage:
+    python model/pack_dataset.py                 # packs (or updates) train and test
+    python model/pack_dataset.py --split train --force
+    python model/pack_dataset.py --leaks --min-correlation 0.9
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+DATASET_DIR = "dataset"
+PACKED_DIR = os.path.join("dataset", "packed")
+IMAGE_SIZE = 48
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+# Near-duplicates: at most this many differing bits of the 64-bit difference
+# hash (a cheap candidate filter), confirmed by the pixel correlation
+NEAR_DUPLICATE_DISTANCE = 8
+NEAR_DUPLICATE_CORRELATION = 0.95
+
+# Set bits per byte value, for Hamming distances between uint64 hashes
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def list_images(split_dir):
+    """Return (classes, file paths, label indices) in flow_from_directory order."""
+    classes = sorted(name for name in os.listdir(split_dir)
+                     if os.path.isdir(os.path.join(split_dir, name)))
+    files, labels = [], []
+    for index, name in enumerate(classes):
+        class_dir = os.path.join(split_dir, name)
+        for fname in sorted(os.listdir(class_dir)):
+            if fname.lower().endswith(IMAGE_EXTENSIONS):
+                files.append(os.path.join(class_dir, fname))
+                labels.append(index)
+    return classes, files, labels
+
+
+def resize_image(image, size=IMAGE_SIZE):
+    if image.shape != (size, size):
+        image = cv2.resize(image, (size, size), interpolation=cv2.INTER_AREA)
+    return image
+
+
+def load_image(path, size=IMAGE_SIZE):
+    """Decode one image straight to a (size, size) grayscale uint8 array."""
+    image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        raise ValueError(f"Could not read image {path}")
+    return resize_image(image, size)
+
+
+def content_hash(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def difference_hash(image):
+    """64-bit dHash: whether each pixel of a 9x8 thumbnail is brighter than its right neighbour.
+    Re-encoding, small crops and brightness changes move only a few bits."""
+    small = cv2.resize(image, (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).reshape(-1)
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def read_file(path):
+    """(content hash, raw bytes) of one file; the bytes are decoded only if the hash is new."""
+    with open(path, "rb") as file:
+        data = file.read()
+    return content_hash(data), data
+
+
+def decode_bytes(path, data, size=IMAGE_SIZE):
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        raise ValueError(f"Could not read image {path}")
+    return resize_image(image, size)
+
+
+def packed_paths(split, packed_dir=PACKED_DIR):
+    out_dir = os.path.join(packed_dir, split)
+    return (os.path.join(out_dir, "images.npy"),
+            os.path.join(out_dir, "labels.npy"),
+            os.path.join(out_dir, "classes.json"))
+
+
+def manifest_path(split, packed_dir=PACKED_DIR):
+    return os.path.join(packed_dir, split, "manifest.json")
+
+
+def _write_json(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(data, file)
+    os.replace(tmp_path, path)
+
+
+def load_manifest(split, packed_dir=PACKED_DIR):
+    """Manifest entries of a split keyed by path, or {} when there is no manifest
+    or it does not belong to the packed arrays on disk (e.g. after an interrupted run)."""
+    images_path, labels_path, meta_path = packed_paths(split, packed_dir)
+    try:
+        with open(meta_path, "r") as file:
+            meta = json.load(file)
+        with open(manifest_path(split, packed_dir), "r") as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    if (not os.path.exists(images_path) or manifest.get("generation") is None
+            or manifest.get("generation") != meta.get("generation")):
+        return {}
+    return {entry["path"]: entry for entry in manifest["files"]}
+
+
+def scan_split(split, dataset_dir=DATASET_DIR):
+    """Manifest entries (without hashes) for the files currently on disk, in packing order."""
+    classes, files, labels = list_images(os.path.join(dataset_dir, split))
+    entries = []
+    for path, label in zip(files, labels):
+        stat = os.stat(path)
+        entries.append({
+            "path": os.path.relpath(path, dataset_dir).replace(os.sep, "/"),
+            "split": split,
+            "label": classes[label],
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+        })
+    return classes, entries, np.asarray(labels, dtype=np.uint8)
+
+
+def _unchanged(entry, previous):
+    return (previous is not None and previous["size"] == entry["size"]
+            and previous["mtime_ns"] == entry["mtime_ns"] and previous["label"] == entry["label"])
+
+
+def is_packed(split, dataset_dir=DATASET_DIR, packed_dir=PACKED_DIR):
+    """True when the packed copy matches the files on disk (same classes, paths, sizes, mtimes and labels)."""
+    manifest = load_manifest(split, packed_dir)
+    if not manifest:
+        return False
+    classes, entries, labels = scan_split(split, dataset_dir)
+    _, labels_path, meta_path = packed_paths(split, packed_dir)
+    with open(meta_path, "r") as file:
+        if json.load(file)["classes"] != classes:
+            return False
+    # A file moved to another class can keep its row, so compare the labels themselves
+    if not np.array_equal(np.load(labels_path), labels):
+        return False
+    return (len(entries) == len(manifest)
+            and all(_unchanged(entry, manifest.get(entry["path"])) for entry in entries)
+            and all(manifest[entry["path"]]["row"] == row for row, entry in enumerate(entries)))
+
+
+def pack_split(split, dataset_dir=DATASET_DIR, packed_dir=PACKED_DIR, workers=None, force=False):
+    """Bring the packed arrays of a split up to date with the files on disk,
+    reading only new or changed files and decoding only content not packed yet."""
+    classes, entries, labels = scan_split(split, dataset_dir)
+    images_path, labels_path, meta_path = packed_paths(split, packed_dir)
+    os.makedirs(os.path.dirname(images_path), exist_ok=True)
+    previous = {} if force else load_manifest(split, packed_dir)
+
+    # Files with a known size and mtime keep their hashes; the rest are read and hashed
+    to_read = []
+    for i, entry in enumerate(entries):
+        old = previous.get(entry["path"])
+        if _unchanged(entry, old):
+            entry.update(hash=old["hash"], dhash=old["dhash"])
+        else:
+            to_read.append(i)
+    paths = [os.path.join(dataset_dir, entries[i]["path"]) for i in to_read]
+    # OpenCV and hashlib release the GIL, so threads are enough here
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        read = list(pool.map(read_file, paths))
+
+        # Content already packed (touched, renamed or moved files) is copied, not decoded
+        packed_rows = {old["hash"]: old for old in previous.values()}
+        to_decode = []
+        for i, (digest, data) in zip(to_read, read):
+            entries[i]["hash"] = digest
+            old = packed_rows.get(digest)
+            if old is not None:
+                entries[i]["dhash"] = old["dhash"]
+            else:
+                to_decode.append((i, data))
+        decoded = list(pool.map(decode_bytes, [os.path.join(dataset_dir, entries[i]["path"]) for i, _ in to_decode],
+                                [data for _, data in to_decode]))
+    del read
+
+    sources = np.full(len(entries), -1, dtype=np.int64)
+    for row, entry in enumerate(entries):
+        # A file keeps its own old row; identical bytes elsewhere in the split are the fallback
+        old = previous.get(entry["path"])
+        if old is None or old["hash"] != entry["hash"]:
+            old = packed_rows.get(entry["hash"])
+        if old is not None:
+            sources[row] = old["row"]
+    for row, entry in enumerate(entries):
+        entry["row"] = row
+    meta = {}
+    if previous:
+        with open(meta_path, "r") as file:
+            meta = json.load(file)
+    if (previous and meta["classes"] == classes and len(entries) == len(previous) and not to_decode
+            and np.array_equal(sources, np.arange(len(entries)))):
+        # Same content in the same order: at most the manifest (touched mtimes,
+        # renames) and the labels (files moved between classes) change
+        relabelled = not np.array_equal(np.load(labels_path), labels)
+        if to_read:
+            _write_json(manifest_path(split, packed_dir), {"generation": meta["generation"], "files": entries})
+        if relabelled:
+            np.save(labels_path, labels)
+            print(f"{split}: images already packed, labels updated ({len(to_read)} files re-hashed)")
+        else:
+            print(f"{split}: already packed ({len(to_read)} files re-hashed)")
+        return
+
+    # Write to a temporary file first so an interrupted run never leaves a
+    # half-filled array behind a valid-looking name.
+    tmp_path = images_path + ".tmp.npy"
+    images = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.uint8,
+                                       shape=(len(entries), IMAGE_SIZE, IMAGE_SIZE))
+    copy = np.flatnonzero(sources >= 0)
+    if len(copy):
+        old_images = np.load(images_path, mmap_mode="r")
+        # Read the old rows in file order, in chunks, to keep memmap access sequential
+        order = copy[np.argsort(sources[copy])]
+        for start in range(0, len(order), 4096):
+            chunk = order[start:start + 4096]
+            images[chunk] = old_images[sources[chunk]]
+        del old_images
+    for (i, _), image in zip(to_decode, decoded):
+        images[i] = image
+        entries[i]["dhash"] = format(difference_hash(image), "016x")
+    images.flush()
+    del images
+
+    # The manifest is written first under a new generation that classes.json only
+    # takes on at the end, so an interrupted run is detected and packed from scratch
+    generation = uuid.uuid4().hex
+    _write_json(manifest_path(split, packed_dir), {"generation": generation, "files": entries})
+    os.replace(tmp_path, images_path)
+    np.save(labels_path, labels)
+    with open(meta_path, "w") as file:
+        json.dump({"classes": classes, "count": len(entries), "image_size": IMAGE_SIZE,
+                   "generation": generation}, file, indent=2)
+    print(f"Packed {len(entries)} {split} images into {os.path.dirname(images_path)} "
+          f"({len(to_decode)} decoded, {len(copy)} reused)")
+
+
+def load_packed(split, packed_dir=PACKED_DIR):
+    """Return (images, labels, classes); images is a read-only memmap."""
+    images_path, labels_path, meta_path = packed_paths(split, packed_dir)
+    with open(meta_path, "r") as file:
+        meta = json.load(file)
+    return np.load(images_path, mmap_mode="r"), np.load(labels_path), meta["classes"]
+
+
+def ensure_packed(split, dataset_dir=DATASET_DIR, packed_dir=PACKED_DIR):
+    """Pack a split if needed and return load_packed(split)."""
+    if not is_packed(split, dataset_dir, packed_dir):
+        pack_split(split, dataset_dir, packed_dir)
+    return load_packed(split, packed_dir)
+
+
+def hamming_distances(hashes, others):
+    """(len(hashes), len(others)) matrix of differing bits between two uint64 hash arrays."""
+    xor = np.bitwise_xor(hashes[:, np.newaxis], others[np.newaxis, :])
+    if hasattr(np, "bitwise_count"):  # numpy >= 2.0
+        return np.bitwise_count(xor)
+    return _POPCOUNT[xor.view(np.uint8)].reshape(xor.shape + (8,)).sum(axis=2, dtype=np.uint8)
+
+
+def pixel_correlation(a, b):
+    """Pearson correlation of the pixels of each pair of rows of two (N, 48, 48) arrays.
+    Two flat images count as identical."""
+    a = a.reshape(len(a), -1).astype(np.float32)
+    b = b.reshape(len(b), -1).astype(np.float32)
+    a -= a.mean(axis=1, keepdims=True)
+    b -= b.mean(axis=1, keepdims=True)
+    norms = np.sqrt((a * a).sum(axis=1) * (b * b).sum(axis=1))
+    flat = norms == 0
+    correlation = (a * b).sum(axis=1) / np.where(flat, 1.0, norms)
+    correlation[flat] = ((a[flat] == 0).all(axis=1) & (b[flat] == 0).all(axis=1)).astype(np.float32)
+    return correlation
+
+
+def find_leaks(train_entries, test_entries, train_images, test_images, max_distance=NEAR_DUPLICATE_DISTANCE,
+               min_correlation=NEAR_DUPLICATE_CORRELATION, chunk_size=256):
+    """(kind, correlation, train entry, test entry) for every test image that is an exact
+    ("exact": same bytes) or near ("near") duplicate of a train image. Entries are
+    manifest entries; images are the packed arrays their "row" fields index."""
+    by_hash = {}
+    for entry in train_entries:
+        by_hash.setdefault(entry["hash"], []).append(entry)
+    train_dhash = np.array([int(entry["dhash"], 16) for entry in train_entries], dtype=np.uint64)
+    train_rows = np.array([entry["row"] for entry in train_entries])
+
+    leaks = []
+    for start in range(0, len(test_entries), chunk_size):
+        chunk = test_entries[start:start + chunk_size]
+        test_dhash = np.array([int(entry["dhash"], 16) for entry in chunk], dtype=np.uint64)
+        rows, columns = np.nonzero(hamming_distances(test_dhash, train_dhash) <= max_distance)
+        if len(rows):
+            test_rows = np.array([chunk[row]["row"] for row in rows])
+            correlation = pixel_correlation(test_images[test_rows], train_images[train_rows[columns]])
+        for entry in chunk:
+            exact = by_hash.get(entry["hash"], [])
+            leaks.extend(("exact", 1.0, match, entry) for match in exact)
+        for row, column, value in zip(rows, columns, correlation if len(rows) else []):
+            entry, match = chunk[row], train_entries[column]
+            if value >= min_correlation and match["hash"] != entry["hash"]:
+                leaks.append(("near", float(value), match, entry))
+    return leaks
+
+
+def report_leaks(dataset_dir=DATASET_DIR, packed_dir=PACKED_DIR, max_distance=NEAR_DUPLICATE_DISTANCE,
+                 min_correlation=NEAR_DUPLICATE_CORRELATION):
+    """Update both splits, write <packed_dir>/leaks.csv and print a summary."""
+    manifests, images = {}, {}
+    for split in ("train", "test"):
+        images[split] = ensure_packed(split, dataset_dir, packed_dir)[0]
+        manifests[split] = sorted(load_manifest(split, packed_dir).values(), key=lambda entry: entry["row"])
+    leaks = find_leaks(manifests["train"], manifests["test"], images["train"], images["test"],
+                       max_distance, min_correlation)
+
+    path = os.path.join(packed_dir, "leaks.csv")
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["kind", "correlation", "train_path", "train_label", "test_path", "test_label"])
+        for kind, correlation, train, test in leaks:
+            writer.writerow([kind, f"{correlation:.4f}", train["path"], train["label"], test["path"], test["label"]])
+    exact = sum(1 for leak in leaks if leak[0] == "exact")
+    affected = len({leak[3]["path"] for leak in leaks})
+    print(f"{exact} exact and {len(leaks) - exact} near-duplicate train/test pairs; "
+          f"{affected} of {len(manifests['test'])} test images affected. Pairs written to {path}")
+    return leaks
+
+
+def validation_split_indices(labels, validation_split):
+    """Split indices like flow_from_directory(validation_split=...): within each
+    class the first int(validation_split * n) files are validation, the rest
+    training. Returns (train_indices, validation_indices)."""
+    labels = np.asarray(labels)
+    train, val = [], []
+    for label in np.unique(labels):
+        indices = np.flatnonzero(labels == label)
+        cut = int(validation_split * len(indices))
+        val.append(indices[:cut])
+        train.append(indices[cut:])
+    return np.concatenate(train), np.concatenate(val)
+
+
+def kfold_indices(labels, folds, seed=0):
+    """Stratified k-fold split: returns a list of (train_indices, validation_indices),
+    one per fold, with every class spread evenly over the folds."""
+    labels = np.asarray(labels)
+    rng = np.random.default_rng(seed)
+    fold_of = np.empty(len(labels), dtype=np.int64)
+    for label in np.unique(labels):
+        indices = rng.permutation(np.flatnonzero(labels == label))
+        fold_of[indices] = np.arange(len(indices)) % folds
+    return [(np.flatnonzero(fold_of != k), np.flatnonzero(fold_of == k)) for k in range(folds)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack dataset images into uint8 .npy files.")
+    parser.add_argument("--split", action="append", help="split to pack (default: train and test)")
+    parser.add_argument("--dataset-dir", default=DATASET_DIR)
+    parser.add_argument("--packed-dir", default=PACKED_DIR)
+    parser.add_argument("--force", action="store_true", help="re-read and re-pack every file")
+    parser.add_argument("--workers", type=int, default=None, help="decode threads")
+    parser.add_argument("--leaks", action="store_true",
+                        help="list test images duplicated (exactly or nearly) in train")
+    parser.add_argument("--max-distance", type=int, default=NEAR_DUPLICATE_DISTANCE,
+                        help="dHash bits that may differ for a near-duplicate candidate")
+    parser.add_argument("--min-correlation", type=float, default=NEAR_DUPLICATE_CORRELATION,
+                        help="pixel correlation a candidate needs to count as a near-duplicate")
+    args = parser.parse_args()
+
+    for split in args.split or ["train", "test"]:
+        pack_split(split, args.dataset_dir, args.packed_dir, args.workers, args.force)
+    if args.leaks:
+        report_leaks(args.dataset_dir, args.packed_dir, args.max_distance, args.min_correlation)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Hyperparameter sweep with k-fold cross-validation for the emotion CNN.
+
+Every combination of the grid options below is trained once per fold. Trials
+run concurrently in a spawn process pool; each worker pins TensorFlow to
+--threads intra-op threads so the trials together do not oversubscribe the
+CPU. All workers read the same packed uint8 dataset (dataset/packed, see
+pack_dataset.py) through a memmap, so the images are decoded once and shared
+through the page cache instead of every trial re-reading the JPEGs.
+
+Results are ranked by mean validation accuracy, then by inference latency
+(measured afterwards, one model at a time, on an untrained copy of each
+architecture). Configurations that no other beats on both are marked pareto.
+
+Usage:
+    python model/sweep.py --folds 3 --epochs 5
+    python model/sweep.py --filters 32,64,128 16,32,64 --dense 64 128 --dropout 0.3 0.5 \\
+        --learning-rate 1e-3 3e-4 --batch-size 64 128 --workers 4 --threads 2
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from pack_dataset import ensure_packed, kfold_indices, load_packed, validation_split_indices
+
+VALIDATION_SPLIT = 0.2
+
+
+def _pin_threads(threads):
+    """Limit TensorFlow (and the BLAS/OpenMP pools) to `threads` threads in this process.
+    Must run before TensorFlow executes its first op."""
+    os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+    return tf
+
+
+def grid(args):
+    """Every combination of the grid options as a list of config dicts."""
+    filters = [tuple(int(n) for n in spec.split(",")) for spec in args.filters]
+    combos = itertools.product(filters, args.dense, args.dropout, args.learning_rate, args.batch_size)
+    return [{"filters": f, "dense": d, "dropout": p, "learning_rate": lr, "batch_size": b}
+            for f, d, p, lr, b in combos]
+
+
+def run_trial(config, fold, folds, epochs, seed):
+    """Train one config on one fold and return its validation accuracy. Runs in a worker process."""
+    import tensorflow as tf
+    from train_model import PackedSequence, build_model
+
+    tf.keras.utils.set_random_seed(seed + fold)
+    # main() packed the data already; workers only map the files
+    images, labels, classes = load_packed("train")
+    if folds > 1:
+        train_idx, val_idx = kfold_indices(labels, folds, seed)[fold]
+    else:
+        train_idx, val_idx = validation_split_indices(labels, VALIDATION_SPLIT)
+    train = PackedSequence(images, labels, train_idx, len(classes), batch_size=config["batch_size"])
+    val = PackedSequence(images, labels, val_idx, len(classes), batch_size=256, shuffle=False)
+
+    model = build_model(config["filters"], config["dense"], config["dropout"])
+    model.compile(optimizer=tf.keras.optimizers.Adam(config["learning_rate"]),
+                  loss='categorical_crossentropy', metrics=['accuracy'])
+    started = time.perf_counter()
+    model.fit(train, epochs=epochs, verbose=0)
+    seconds = time.perf_counter() - started
+    _, accuracy = model.evaluate(val, verbose=0)
+    return {"accuracy": float(accuracy), "train_seconds": seconds, "params": int(model.count_params())}
+
+
+def measure_latency(config, batch_size, repeats=50):
+    """Median milliseconds per image for predict_on_batch on an untrained copy of the architecture."""
+    import tensorflow as tf
+    from train_model import build_model
+
+    model = build_model(config["filters"], config["dense"], config["dropout"])
+    batch = tf.zeros((batch_size, 48, 48, 1))
+    for _ in range(5):
+        model.predict_on_batch(batch)
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        model.predict_on_batch(batch)
+        samples.append(time.perf_counter() - started)
+    return float(np.median(samples)) * 1000 / batch_size
+
+
+def mark_pareto(rows):
+    """Flag rows that no other row beats on both accuracy and single-image latency."""
+    for row in rows:
+        row["pareto"] = not any(
+            other["accuracy_mean"] >= row["accuracy_mean"] and other["latency_ms_1"] <= row["latency_ms_1"]
+            and (other["accuracy_mean"] > row["accuracy_mean"] or other["latency_ms_1"] < row["latency_ms_1"])
+            for other in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel hyperparameter sweep with k-fold cross-validation.")
+    parser.add_argument("--filters", nargs="+", default=["32,64,128"], help="conv filter counts, e.g. 32,64,128")
+    parser.add_argument("--dense", type=int, nargs="+", default=[128])
+    parser.add_argument("--dropout", type=float, nargs="+", default=[0.5])
+    parser.add_argument("--learning-rate", type=float, nargs="+", default=[1e-3])
+    parser.add_argument("--batch-size", type=int, nargs="+", default=[64])
+    parser.add_argument("--folds", type=int, default=3, help="k for k-fold (1 = the usual 80/20 split)")
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=None, help="concurrent trials (default: cores / threads)")
+    parser.add_argument("--threads", type=int, default=2, help="TensorFlow intra-op threads per trial")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output-dir", default="sweep")
+    args = parser.parse_args()
+
+    configs = grid(args)
+    folds = max(1, args.folds)
+    threads = max(1, args.threads)
+    workers = args.workers or max(1, (os.cpu_count() or 1) // threads)
+    # Decode the JPEGs once up front; every worker then maps the same packed files
+    ensure_packed("train")
+
+    tasks = [(i, fold) for i in range(len(configs)) for fold in range(folds)]
+    print(f"{len(configs)} configurations x {folds} folds = {len(tasks)} trials "
+          f"on {workers} workers x {threads} threads")
+    results = [[] for _ in configs]
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_pin_threads, initargs=(threads,)) as pool:
+        futures = {pool.submit(run_trial, configs[i], fold, folds, args.epochs, args.seed): (i, fold)
+                   for i, fold in tasks}
+        for done, future in enumerate(as_completed(futures), 1):
+            i, fold = futures[future]
+            trial = future.result()
+            results[i].append(trial)
+            print(f"[{done}/{len(tasks)}] config {i} fold {fold}: accuracy {trial['accuracy']:.4f} "
+                  f"({trial['train_seconds']:.0f}s)")
+    elapsed = time.perf_counter() - started
+
+    # Latency is timed after the pool has finished so trials do not skew it
+    _pin_threads(threads)
+    rows = []
+    for config, trials in zip(configs, results):
+        accuracies = np.array([t["accuracy"] for t in trials])
+        rows.append({
+            "filters": ",".join(str(n) for n in config["filters"]),
+            "dense": config["dense"],
+            "dropout": config["dropout"],
+            "learning_rate": config["learning_rate"],
+            "batch_size": config["batch_size"],
+            "params": trials[0]["params"],
+            "accuracy_mean": float(accuracies.mean()),
+            "accuracy_std": float(accuracies.std()),
+            "train_seconds": float(np.mean([t["train_seconds"] for t in trials])),
+            "latency_ms_1": measure_latency(config, 1),
+            "latency_ms_64": measure_latency(config, 64),
+        })
+    mark_pareto(rows)
+    rows.sort(key=lambda row: (-row["accuracy_mean"], row["latency_ms_1"]))
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    with open(os.path.join(args.output_dir, "results.csv"), "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    with open(os.path.join(args.output_dir, "results.json"), "w") as file:
+        json.dump({"folds": folds, "epochs": args.epochs, "workers": workers, "threads": threads,
+                   "seconds": elapsed, "results": rows}, file, indent=2)
+
+    print(f"\nSweep finished in {elapsed:.0f}s (ranked by accuracy, then latency):")
+    print(f"{'rank':>4} {'filters':<12} {'dense':>5} {'drop':>5} {'lr':>8} {'batch':>5} "
+          f"{'accuracy':>15} {'ms/img':>7} {'ms/img@64':>9}  pareto")
+    for rank, row in enumerate(rows, 1):
+        print(f"{rank:>4} {row['filters']:<12} {row['dense']:>5} {row['dropout']:>5} {row['learning_rate']:>8g} "
+              f"{row['batch_size']:>5} {row['accuracy_mean']:>8.4f}±{row['accuracy_std']:.4f} "
+              f"{row['latency_ms_1']:>7.3f} {row['latency_ms_64']:>9.4f}  {'*' if row['pareto'] else ''}")
+    print(f"Results written to {args.output_dir}/results.csv")
+
+
+if __name__ == "__main__":
+    main()
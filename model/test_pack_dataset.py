@@ -0,0 +1,41 @@
+"""
+Regression checks for incremental packing (python -m pytest model/test_pack_dataset.py).
+"""
+
+import os
+
+import cv2
+import numpy as np
+
+from pack_dataset import is_packed, load_packed, pack_split
+
+
+def make_split(root, files):
+    rng = np.random.default_rng(0)
+    for path in files:
+        full = os.path.join(root, "train", path)
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        cv2.imwrite(full, rng.integers(0, 256, (48, 48), dtype=np.uint8))
+
+
+def test_move_between_classes_updates_labels(tmp_path):
+    dataset, packed = str(tmp_path / "dataset"), str(tmp_path / "packed")
+    make_split(dataset, ["angry/a0.jpg", "angry/a1.jpg", "angry/a2.jpg",
+                         "disgust/d0.jpg", "disgust/d1.jpg", "disgust/d2.jpg"])
+    pack_split("train", dataset, packed)
+    assert load_packed("train", packed)[1].tolist() == [0, 0, 0, 1, 1, 1]
+
+    # Sorts first in disgust/, so the image keeps its row but changes class
+    os.rename(os.path.join(dataset, "train", "angry", "a2.jpg"),
+              os.path.join(dataset, "train", "disgust", "c0.jpg"))
+    assert not is_packed("train", dataset, packed)
+
+    pack_split("train", dataset, packed)
+    assert is_packed("train", dataset, packed)
+    images, labels, _ = load_packed("train", packed)
+    assert labels.tolist() == [0, 0, 1, 1, 1, 1]
+
+    pack_split("train", dataset, str(tmp_path / "fresh"), force=True)
+    fresh_images, fresh_labels, _ = load_packed("train", str(tmp_path / "fresh"))
+    assert np.array_equal(images, fresh_images)
+    assert np.array_equal(labels, fresh_labels)
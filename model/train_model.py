@@ -36,62 +36,418 @@
 # print("Model trained and saved as emotion_model.h5")
 
 
+import argparse
+import json
+import math
+import numpy as np
 import tensorflow as tf
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import Conv2D, MaxPooling2D, Flatten, Dense, Dropout
+from tensorflow.keras.models import Model, Sequential
+from tensorflow.keras.layers import (Conv2D, Dense, Dropout, Flatten, GlobalAveragePooling2D, Input,
+                                     MaxPooling2D, Rescaling, SeparableConv2D, Softmax)
 from tensorflow.keras.preprocessing.image import ImageDataGenerator
 import os
+import sys
+import time
+
+from pack_dataset import ensure_packed, list_images, load_image, validation_split_indices
+from convert_tflite import keras_predict
+from data_pipeline import train_val_datasets
+
+# inference.TracedModel (used to time the serving path) lives at the repo root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Dataset Path
 dataset_path = "dataset/train"
+MODEL_PATH = "model/emotion_model.h5"
+
+BATCH_SIZE = 64
+VALIDATION_SPLIT = 0.2
+EPOCHS = 20
+
+# Fine-tuning (--finetune): few epochs at a low learning rate, checkpointed every epoch
+FINETUNE_EPOCHS = 5
+FINETUNE_LEARNING_RATE = 1e-4
+FINETUNE_OUTPUT = "model/emotion_model_finetuned.h5"
+CHECKPOINT_DIR = "model/finetune_checkpoint"
+
+# Distillation (--distill): a compact student trained on the teacher's softened outputs
+DISTILL_OUTPUT = "model/emotion_model_student.h5"
+DISTILL_LEARNING_RATE = 1e-3
+DISTILL_TEMPERATURE = 4.0
+DISTILL_ALPHA = 0.3
+
+
+class PackedSequence(tf.keras.utils.Sequence):
+    """Batches from the packed uint8 memmap, rescaled to [0, 1] per batch."""
+
+    def __init__(self, images, labels, indices, num_classes, batch_size=BATCH_SIZE, shuffle=True, **kwargs):
+        super().__init__(**kwargs)
+        self.images = images
+        self.labels = labels
+        self.indices = np.array(indices)
+        self.num_classes = num_classes
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        if shuffle:
+            np.random.shuffle(self.indices)
+
+    def __len__(self):
+        return math.ceil(len(self.indices) / self.batch_size)
+
+    def __getitem__(self, index):
+        # Sorted reads keep memmap access sequential within a batch
+        batch = np.sort(self.indices[index * self.batch_size:(index + 1) * self.batch_size])
+        x = self.images[batch].astype(np.float32)[..., np.newaxis] / 255.0
+        y = np.eye(self.num_classes, dtype=np.float32)[self.labels[batch]]
+        return x, y
+
+    def on_epoch_end(self):
+        if self.shuffle:
+            np.random.shuffle(self.indices)
+
+
+class DistillSequence(PackedSequence):
+    """PackedSequence batches with the teacher's softened probabilities as a second target."""
+
+    def __init__(self, images, labels, soft_labels, indices, num_classes, **kwargs):
+        super().__init__(images, labels, indices, num_classes, **kwargs)
+        self.soft_labels = soft_labels
+
+    def __getitem__(self, index):
+        x, y = super().__getitem__(index)
+        # The same sorted rows PackedSequence read the batch from
+        batch = np.sort(self.indices[index * self.batch_size:(index + 1) * self.batch_size])
+        return x, (y, self.soft_labels[batch])
+
+
+class ReplaySequence(tf.keras.utils.Sequence):
+    """New captures (in memory) mixed with a replay sample of the original
+    training set (packed memmap). A fresh replay sample is drawn every epoch
+    so the model sees more of the old data without each epoch growing."""
+
+    def __init__(self, new_images, new_labels, replay_images, replay_labels, replay_pool,
+                 replay_count, num_classes, batch_size=BATCH_SIZE, seed=0, **kwargs):
+        super().__init__(**kwargs)
+        self.new_images = new_images
+        self.new_labels = np.asarray(new_labels)
+        self.replay_images = replay_images
+        self.replay_labels = replay_labels
+        self.replay_pool = np.asarray(replay_pool)
+        self.replay_count = min(int(replay_count), len(self.replay_pool))
+        self.num_classes = num_classes
+        self.batch_size = batch_size
+        self.rng = np.random.default_rng(seed)
+        self.on_epoch_end()
+
+    def __len__(self):
+        return math.ceil(len(self.order) / self.batch_size)
+
+    def __getitem__(self, index):
+        batch = self.order[index * self.batch_size:(index + 1) * self.batch_size]
+        n_new = len(self.new_labels)
+        x = np.empty((len(batch), 48, 48), dtype=np.uint8)
+        y = np.empty(len(batch), dtype=np.int64)
+        new = batch < n_new
+        x[new] = self.new_images[batch[new]]
+        y[new] = self.new_labels[batch[new]]
+        positions = np.flatnonzero(~new)
+        if len(positions):
+            # Sorted reads keep memmap access sequential within a batch
+            rows = self.replay[batch[~new] - n_new]
+            order = np.argsort(rows)
+            x[positions[order]] = self.replay_images[rows[order]]
+            y[positions[order]] = self.replay_labels[rows[order]]
+        return x.astype(np.float32)[..., np.newaxis] / 255.0, np.eye(self.num_classes, dtype=np.float32)[y]
+
+    def on_epoch_end(self):
+        self.replay = self.rng.choice(self.replay_pool, self.replay_count, replace=False)
+        self.order = self.rng.permutation(len(self.new_labels) + self.replay_count)
+
+
+def load_captures(directory, classes):
+    """Load a <class>/<image> tree of new captures as (uint8 images, labels) using
+    the label indices of `classes` (class folders are matched case-insensitively)."""
+    names, files, labels = list_images(directory)
+    index = {name.lower(): i for i, name in enumerate(classes)}
+    unknown = [name for name in names if name.lower() not in index]
+    if unknown:
+        raise SystemExit(f"Unknown class folders in {directory}: {', '.join(unknown)} "
+                         f"(expected some of {', '.join(classes)})")
+    images = np.zeros((len(files), 48, 48), dtype=np.uint8)
+    for i, path in enumerate(files):
+        images[i] = load_image(path)
+    return images, np.array([index[names[label].lower()] for label in labels], dtype=np.int64)
+
+
+def finetune_inputs(directory, replay_ratio):
+    """(train, new-capture validation, original validation) for fine-tuning."""
+    images, labels, classes = ensure_packed("train")
+    new_images, new_labels = load_captures(directory, classes)
+    if not len(new_labels):
+        raise SystemExit(f"No images found under {directory}")
+    new_train, new_val = validation_split_indices(new_labels, VALIDATION_SPLIT)
+    original_train, original_val = validation_split_indices(labels, VALIDATION_SPLIT)
+    replay_count = int(round(replay_ratio * len(new_train)))
+    print(f"Fine-tuning on {len(new_train)} new images ({len(new_val)} held out) "
+          f"plus {replay_count} replayed original images per epoch.")
+
+    train = ReplaySequence(new_images[new_train], new_labels[new_train], images, labels,
+                           original_train, replay_count, len(classes))
+    val = (new_images[new_val].astype(np.float32)[..., np.newaxis] / 255.0,
+           np.eye(len(classes), dtype=np.float32)[new_labels[new_val]]) if len(new_val) else None
+    original = PackedSequence(images, labels, original_val, len(classes), shuffle=False)
+    return train, val, original
+
+
+def load_for_finetune(path, freeze_conv, learning_rate):
+    """Load a trained model, optionally freezing its conv layers, and compile it for fine-tuning."""
+    model = tf.keras.models.load_model(path)
+    if freeze_conv:
+        for layer in model.layers:
+            if isinstance(layer, Conv2D):
+                layer.trainable = False
+    model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate),
+                  loss='categorical_crossentropy', metrics=['accuracy'])
+    return model
+
+
+def finetune(args):
+    train_data, val_data, original_val = finetune_inputs(args.finetune, args.replay_ratio)
+    model = load_for_finetune(args.base_model, args.freeze_conv, args.learning_rate or FINETUNE_LEARNING_RATE)
+    trainable = sum(int(np.prod(w.shape)) for w in model.trainable_weights)
+    print(f"Loaded {args.base_model} ({trainable} trainable parameters"
+          f"{', conv layers frozen' if args.freeze_conv else ''}).")
+
+    _, before = model.evaluate(original_val, verbose=0)
+    # BackupAndRestore resumes from the last finished epoch if a previous run was interrupted
+    callbacks = [tf.keras.callbacks.BackupAndRestore(args.checkpoint_dir)]
+    model.fit(train_data, validation_data=val_data, epochs=args.epochs or FINETUNE_EPOCHS,
+              callbacks=callbacks)
+    _, after = model.evaluate(original_val, verbose=0)
+    print(f"Original validation accuracy: {before:.4f} -> {after:.4f}")
+
+    output = args.output or FINETUNE_OUTPUT
+    model.save(output)
+    print(f"Fine-tuned model saved as {output} (serve it with MODEL_PATH={output})")
+
+
+def soften(probabilities, temperature):
+    """Re-scale probabilities to a temperature: softmax(log(p) / T)."""
+    logits = np.log(np.clip(probabilities, 1e-7, 1.0)) / temperature
+    soft = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return (soft / soft.sum(axis=1, keepdims=True)).astype(np.float32)
+
+
+def build_student(filters=(16, 32, 64, 128), dropout=0.3):
+    """Compact student CNN: one plain conv, then depthwise-separable convs, with global
+    average pooling in place of the teacher's Flatten -> Dense(128) block."""
+    inputs = Input((48, 48, 1))
+    x = Conv2D(filters[0], (3, 3), padding='same', activation='relu')(inputs)
+    x = MaxPooling2D(2, 2)(x)
+    for count in filters[1:]:
+        x = SeparableConv2D(count, (3, 3), padding='same', activation='relu')(x)
+        x = MaxPooling2D(2, 2)(x)
+    x = GlobalAveragePooling2D()(x)
+    x = Dropout(dropout)(x)
+    logits = Dense(7, name='logits')(x)
+    return Model(inputs, Softmax(name='probabilities')(logits))
+
+
+def distillation_model(student, temperature):
+    """The student with a second, temperature-softened output for the teacher's soft labels.
+    Shares the student's weights; only the student itself is saved."""
+    logits = student.get_layer('logits').output
+    soft = Softmax(name='soft_probabilities')(Rescaling(1.0 / temperature)(logits))
+    return Model(student.inputs, [student.output, soft])
+
+
+def per_frame_latency(model, repeats=200):
+    """Median milliseconds for one 48x48 face through the serving path (inference.TracedModel)."""
+    from inference import TracedModel
+    traced = TracedModel(model, [1])
+    traced.warmup()
+    face = np.random.rand(1, 48, 48, 1).astype(np.float32)
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        traced.predict_on_batch(face)
+        samples.append(time.perf_counter() - started)
+    return float(np.median(samples)) * 1000
+
+
+def distill(args):
+    images, labels, classes = ensure_packed("train")
+    teacher = tf.keras.models.load_model(args.teacher)
+    print(f"Labelling {len(labels)} training images with {args.teacher} (T={args.temperature})...")
+    soft_labels = soften(keras_predict(teacher, images), args.temperature)
+
+    train_idx, val_idx = validation_split_indices(labels, VALIDATION_SPLIT)
+    train = DistillSequence(images, labels, soft_labels, train_idx, len(classes))
+    val = DistillSequence(images, labels, soft_labels, val_idx, len(classes), shuffle=False)
+
+    student = build_student()
+    trainer = distillation_model(student, args.temperature)
+    # Hinton et al.: the soft-label term is scaled by T^2 to keep its gradients comparable
+    trainer.compile(optimizer=tf.keras.optimizers.Adam(args.learning_rate or DISTILL_LEARNING_RATE),
+                    loss=['categorical_crossentropy', 'kl_divergence'],
+                    loss_weights=[args.alpha, (1 - args.alpha) * args.temperature ** 2],
+                    metrics=[['accuracy'], []])
+    print(f"Student: {student.count_params()} parameters (teacher: {teacher.count_params()}).")
+    trainer.fit(train, validation_data=val, epochs=args.epochs or EPOCHS)
+
+    output = args.output or DISTILL_OUTPUT
+    student.compile(loss='categorical_crossentropy', metrics=['accuracy'])
+    student.save(output)
+
+    # Compare both models on the held-out test split
+    test_images, test_labels, _ = ensure_packed("test")
+    teacher_predicted = keras_predict(teacher, test_images).argmax(axis=1)
+    report = {"test_images": int(len(test_labels)), "temperature": args.temperature, "alpha": args.alpha}
+    for name, model, path in (("teacher", teacher, args.teacher), ("student", student, output)):
+        predicted = teacher_predicted if name == "teacher" else keras_predict(model, test_images).argmax(axis=1)
+        latency = per_frame_latency(model)
+        report[name] = {
+            "path": path,
+            "parameters": int(model.count_params()),
+            "size_bytes": os.path.getsize(path),
+            "accuracy": float((predicted == test_labels).mean()),
+            "agreement_with_teacher": float((predicted == teacher_predicted).mean()),
+            "ms_per_frame": latency,
+            "max_fps": 1000.0 / latency,
+        }
+        print(f"{name:<8} accuracy {report[name]['accuracy']:.4f}  {report[name]['parameters']:>8} params  "
+              f"{latency:.3f} ms/frame ({report[name]['max_fps']:.0f} FPS)")
+    report["speedup"] = report["teacher"]["ms_per_frame"] / report["student"]["ms_per_frame"]
+    report["accuracy_delta"] = report["student"]["accuracy"] - report["teacher"]["accuracy"]
+
+    report_path = os.path.splitext(output)[0] + "_report.json"
+    with open(report_path, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Student saved as {output} (serve it with MODEL_PATH={output}); report written to {report_path}")
+
+
+def packed_inputs():
+    """Train/validation batches read from the packed dataset cache (packed on first use)."""
+    images, labels, classes = ensure_packed("train")
+    train_idx, val_idx = validation_split_indices(labels, VALIDATION_SPLIT)
+    print(f"Found {len(train_idx)} training and {len(val_idx)} validation images "
+          f"belonging to {len(classes)} classes (packed).")
+    train = PackedSequence(images, labels, train_idx, len(classes), shuffle=True)
+    val = PackedSequence(images, labels, val_idx, len(classes), shuffle=False)
+    return train, val
+
+
+def tfdata_inputs(cache="", augment=False):
+    """Parallel-decoded, cached and prefetched tf.data input over the JPEGs."""
+    train, val, _ = train_val_datasets(dataset_path, BATCH_SIZE, VALIDATION_SPLIT,
+                                       cache=cache, augment=augment)
+    return train, val
+
+
+def generator_inputs():
+    """Original ImageDataGenerator input, decoding every JPEG on every epoch."""
+    # Data Augmentation
+    train_datagen = ImageDataGenerator(rescale=1./255, validation_split=VALIDATION_SPLIT)
+
+    train_generator = train_datagen.flow_from_directory(
+        dataset_path,
+        target_size=(48, 48),
+        batch_size=BATCH_SIZE,
+        color_mode="grayscale",
+        class_mode="categorical",
+        subset="training"
+    )
+
+    val_generator = train_datagen.flow_from_directory(
+        dataset_path,
+        target_size=(48, 48),
+        batch_size=BATCH_SIZE,
+        color_mode="grayscale",
+        class_mode="categorical",
+        subset="validation"
+    )
+    return train_generator, val_generator
+
+
+def build_model(filters=(32, 64, 128), dense=128, dropout=0.5):
+    # CNN Model: one conv + pool block per entry in filters (the defaults are the original model)
+    layers = []
+    for i, count in enumerate(filters):
+        if i == 0:
+            layers.append(Conv2D(count, (3, 3), activation='relu', input_shape=(48, 48, 1)))
+        else:
+            layers.append(Conv2D(count, (3, 3), activation='relu'))
+        layers.append(MaxPooling2D(2, 2))
+    return Sequential(layers + [
+        Flatten(),
+        Dense(dense, activation='relu'),
+        Dropout(dropout),
+        Dense(7, activation='softmax')  # 7 Emotion categories
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the emotion CNN.")
+    parser.add_argument("--input", choices=["packed", "tfdata", "generator"], default="packed",
+                        help="packed: uint8 memmap cache (default); tfdata: tf.data pipeline over JPEGs; "
+                             "generator: ImageDataGenerator over JPEGs")
+    parser.add_argument("--cache", default="",
+                        help="tfdata only: on-disk cache file prefix (default: cache in memory)")
+    parser.add_argument("--augment", action="store_true", help="tfdata only: random flips and brightness")
+    parser.add_argument("--epochs", type=int, default=None,
+                        help=f"default {EPOCHS}, or {FINETUNE_EPOCHS} with --finetune")
+    parser.add_argument("--learning-rate", type=float, default=None,
+                        help=f"--finetune: default {FINETUNE_LEARNING_RATE}; --distill: default {DISTILL_LEARNING_RATE}")
+    parser.add_argument("--output", default=None,
+                        help=f"--finetune: default {FINETUNE_OUTPUT}; --distill: default {DISTILL_OUTPUT}")
+    finetuning = parser.add_argument_group("fine-tuning")
+    finetuning.add_argument("--finetune", metavar="DIR",
+                            help="fine-tune --base-model on new captures laid out as DIR/<class>/*.jpg")
+    finetuning.add_argument("--base-model", default=MODEL_PATH)
+    finetuning.add_argument("--freeze-conv", action="store_true", help="train only the dense layers")
+    finetuning.add_argument("--replay-ratio", type=float, default=1.0,
+                            help="original training images replayed per new image, each epoch")
+    finetuning.add_argument("--checkpoint-dir", default=CHECKPOINT_DIR,
+                            help="resume point kept while training; removed when it finishes")
+    distillation = parser.add_argument_group("distillation")
+    distillation.add_argument("--distill", action="store_true",
+                              help="train the compact student model from --teacher's soft labels")
+    distillation.add_argument("--teacher", default=MODEL_PATH)
+    distillation.add_argument("--temperature", type=float, default=DISTILL_TEMPERATURE,
+                              help="softening applied to the teacher (and student) outputs")
+    distillation.add_argument("--alpha", type=float, default=DISTILL_ALPHA,
+                              help="weight of the true-label loss; the rest goes to the teacher's soft labels")
+    args = parser.parse_args()
+
+    # Ensure model directory exists
+    os.makedirs("model", exist_ok=True)
+
+    if args.finetune:
+        finetune(args)
+        return
+    if args.distill:
+        distill(args)
+        return
+
+    if args.input == "packed":
+        train_data, val_data = packed_inputs()
+    elif args.input == "tfdata":
+        train_data, val_data = tfdata_inputs(args.cache, args.augment)
+    else:
+        train_data, val_data = generator_inputs()
+
+    model = build_model()
+
+    # Compile Model
+    model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
+
+    # Train Model
+    model.fit(train_data, validation_data=val_data, epochs=args.epochs or EPOCHS)
+
+    # Save Model
+    model.save(MODEL_PATH)
+    print(f"Model trained and saved as {MODEL_PATH}")
+
 
-# Ensure model directory exists
-os.makedirs("model", exist_ok=True)
-
-# Data Augmentation
-train_datagen = ImageDataGenerator(rescale=1./255, validation_split=0.2)
-
-train_generator = train_datagen.flow_from_directory(
-    dataset_path,
-    target_size=(48, 48),
-    batch_size=64,
-    color_mode="grayscale",
-    class_mode="categorical",
-    subset="training"
-)
-
-val_generator = train_datagen.flow_from_directory(
-    dataset_path,
-    target_size=(48, 48),
-    batch_size=64,
-    color_mode="grayscale",
-    class_mode="categorical",
-    subset="validation"
-)
-
-# CNN Model
-model = Sequential([
-    Conv2D(32, (3, 3), activation='relu', input_shape=(48, 48, 1)),
-    MaxPooling2D(2, 2),
-    
-    Conv2D(64, (3, 3), activation='relu'),
-    MaxPooling2D(2, 2),
-    
-    Conv2D(128, (3, 3), activation='relu'),  # Extra layer added
-    MaxPooling2D(2, 2),
-    
-    Flatten(),
-    Dense(128, activation='relu'),
-    Dropout(0.5),
-    Dense(7, activation='softmax')  # 7 Emotion categories
-])
-
-# Compile Model
-model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
-
-# Train Model
-model.fit(train_generator, validation_data=val_generator, epochs=20)
-
-# Save Model
-model.save("model/emotion_model.h5")
-print("Model trained and saved as model/emotion_model.h5")
+if __name__ == "__main__":
+    main()
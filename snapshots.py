@@ -0,0 +1,149 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+import metrics
+from capture import JPEG_QUALITY, encode_jpeg, resize_to_width
+from image_io import image_size
+
+# How many result snapshots are kept, and for how long (seconds)
+SNAPSHOT_MAX_ITEMS = int(os.environ.get("SNAPSHOT_MAX_ITEMS", 64))
+SNAPSHOT_TTL_SECONDS = float(os.environ.get("SNAPSHOT_TTL_SECONDS", 300))
+# Shared by every worker process, so any of them can serve a snapshot another rendered
+SNAPSHOT_DIR = os.environ.get("SNAPSHOT_DIR", os.path.join(tempfile.gettempdir(), "stress-detection-snapshots"))
+THUMBNAIL_WIDTH = int(os.environ.get("THUMBNAIL_WIDTH", 160))
+
+SNAPSHOT_REQUESTS = metrics.counter(
+    "snapshot_requests", "Snapshot image requests by result.", ["result"])
+
+_SNAPSHOT_ID = re.compile(r"[0-9a-f]{24}")
+
+_REDUCED_COLOR_FLAGS = {
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+}
+
+
+def _write_atomic(path, data):
+    # Readers in other processes never see a half-written file
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(data)
+    os.replace(tmp_path, path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass  # another worker pruned it first
+
+
+class Snapshot:
+    """One stored JPEG. The id is a hash of the bytes, so it doubles as the ETag."""
+
+    def __init__(self, snapshot_id, path):
+        self.id = snapshot_id
+        self.path = path
+
+    @property
+    def jpeg(self):
+        # Raises FileNotFoundError if another worker pruned it since get()
+        with open(self.path, "rb") as file:
+            return file.read()
+
+    def thumbnail(self, width=THUMBNAIL_WIDTH):
+        # Built on first request by whichever worker gets it; the decoder does
+        # most of the downscaling
+        path = self.path[:-len(".jpg")] + f".thumb{width}.jpg"
+        try:
+            with open(path, "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            thumbnail = make_thumbnail(self.jpeg, width)
+            _write_atomic(path, thumbnail)
+            return thumbnail
+
+
+class SnapshotStore:
+    """Bounded, expiring store of result images in a directory shared by all workers.
+
+    Files are named by a hash of their bytes and expire SNAPSHOT_TTL_SECONDS
+    after they were last stored (their mtime). Storing the same bytes twice
+    returns the same id, so repeated /get_advice calls on one camera frame
+    share a URL and browser cache entry.
+    """
+
+    def __init__(self, directory=SNAPSHOT_DIR, max_items=SNAPSHOT_MAX_ITEMS, ttl=SNAPSHOT_TTL_SECONDS):
+        self.directory = directory
+        self.max_items = max(1, max_items)
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, snapshot_id):
+        return os.path.join(self.directory, snapshot_id + ".jpg")
+
+    def put(self, jpeg):
+        """Store JPEG bytes and return the snapshot id."""
+        snapshot_id = hashlib.blake2b(jpeg, digest_size=12).hexdigest()
+        path = self._path(snapshot_id)
+        try:
+            os.utime(path)  # already stored: just restart its TTL
+        except FileNotFoundError:
+            _write_atomic(path, jpeg)
+            self._prune()
+        return snapshot_id
+
+    def get(self, snapshot_id):
+        """The Snapshot for snapshot_id, or None if unknown or expired."""
+        if not _SNAPSHOT_ID.fullmatch(snapshot_id):
+            return None
+        path = self._path(snapshot_id)
+        try:
+            if os.stat(path).st_mtime + self.ttl <= time.time():
+                return None
+        except FileNotFoundError:
+            return None
+        return Snapshot(snapshot_id, path)
+
+    def _prune(self):
+        # Drop expired snapshots, then the least recently stored beyond max_items,
+        # together with their thumbnails
+        now = time.time()
+        snapshots, files = [], {}
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                snapshot_id = entry.name.split(".", 1)[0]
+                files.setdefault(snapshot_id, []).append(entry.path)
+                if entry.name == snapshot_id + ".jpg":
+                    try:
+                        snapshots.append((entry.stat().st_mtime, snapshot_id))
+                    except FileNotFoundError:
+                        continue
+        snapshots.sort(reverse=True)
+        for i, (mtime, snapshot_id) in enumerate(snapshots):
+            if i >= self.max_items or mtime + self.ttl <= now:
+                for path in files[snapshot_id]:
+                    _remove(path)
+
+
+def make_thumbnail(jpeg, width=THUMBNAIL_WIDTH, quality=JPEG_QUALITY):
+    """Re-encode JPEG bytes at `width` pixels wide, decoding at reduced size when possible."""
+    size = image_size(jpeg)
+    flag = cv2.IMREAD_COLOR
+    if size is not None:
+        for factor in (8, 4, 2):
+            if size[0] // factor >= width:
+                flag = _REDUCED_COLOR_FLAGS[factor]
+                break
+    image = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), flag)
+    if image is None:
+        raise ValueError("Snapshot is not a readable JPEG")
+    return encode_jpeg(resize_to_width(image, width), quality)
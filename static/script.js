@@ -1,8 +1,27 @@
+function showResult(data) {
+    document.getElementById("result").innerHTML =
+        "Emotion: " + data.emotion + "<br>Advice: " + data.advice;
+}
+
 function getAdvice() {
-    fetch("/get_advice")
+    fetch("/api/latest")
     .then(response => response.json())
     .then(data => {
-        document.getElementById("result").innerHTML =
-            "Emotion: " + data.emotion + "<br>Advice: " + data.advice;
+        if (!data.error) {
+            showResult(data);
+        }
     });
-}
\ No newline at end of file
+}
+
+// Live results pushed by the server's background analysis loop
+function subscribeToResults() {
+    if (!window.EventSource || !document.getElementById("result")) {
+        return;
+    }
+    const source = new EventSource("/events");
+    // No onerror handler: the browser reconnects after network errors or a
+    // worker restart, and gives up by itself when /events answers 503
+    source.onmessage = event => showResult(JSON.parse(event.data));
+}
+
+subscribeToResults();
\ No newline at end of file
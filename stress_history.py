@@ -0,0 +1,294 @@
+"""
+Per-session emotion/stress history in fixed-size numpy ring buffers.
+
+Each session keeps its latest samples (timestamp + class probabilities) in a
+ring, running sums for a rolling window of the last STRESS_WINDOW samples
+(updated in O(1) per sample), and a second ring of time buckets holding
+per-bucket sums. History queries read only the buckets, never the raw
+samples.
+
+SessionStore keeps each session's buffers in one file under SESSION_DIR,
+so every gunicorn worker reads and updates the same history whichever of
+them serves a request. Each operation opens the file, locks it, reads (and
+for a push rewrites) the record and closes it again, so no descriptors stay
+open between requests. A session's file is created by its first sample.
+Sessions untouched for SESSION_TTL_SECONDS, and the oldest beyond
+SESSION_MAX, are deleted, so disk use stays bounded however many clients
+connect.
+"""
+
+import contextlib
+import hashlib
+import math
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from analysis import STRESS_EMOTIONS
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single process, so the thread lock is enough
+    fcntl = None
+
+SESSION_MAX = int(os.environ.get("SESSION_MAX", 2000))
+# Raw samples kept per session, and how many of the newest form the rolling window
+SESSION_HISTORY_SIZE = int(os.environ.get("SESSION_HISTORY_SIZE", 256))
+STRESS_WINDOW = int(os.environ.get("STRESS_WINDOW", 20))
+# Charting history: HISTORY_BUCKETS buckets of HISTORY_BUCKET_SECONDS each (1 hour by default)
+HISTORY_BUCKET_SECONDS = float(os.environ.get("HISTORY_BUCKET_SECONDS", 10))
+HISTORY_BUCKETS = int(os.environ.get("HISTORY_BUCKETS", 360))
+# Shared by every worker process; sessions idle longer than the TTL are deleted
+SESSION_DIR = os.environ.get("SESSION_DIR", os.path.join(tempfile.gettempdir(), "stress-detection-sessions"))
+SESSION_TTL_SECONDS = float(os.environ.get("SESSION_TTL_SECONDS", HISTORY_BUCKETS * HISTORY_BUCKET_SECONDS))
+
+
+def session_dtype(classes, capacity, num_buckets):
+    """Layout of one session's buffers, in memory or in its file."""
+    return np.dtype([
+        ("count", np.int64),  # samples ever pushed; the newest is at (count - 1) % capacity
+        ("window_probabilities", np.float64, (classes,)),
+        ("window_stress", np.float64),
+        ("times", np.float64, (capacity,)),
+        ("probabilities", np.float32, (capacity, classes)),
+        ("stress", np.float32, (capacity,)),
+        ("bucket_keys", np.int64, (num_buckets,)),
+        ("bucket_counts", np.int32, (num_buckets,)),
+        ("bucket_probabilities", np.float32, (num_buckets, classes)),
+        ("bucket_stress", np.float32, (num_buckets,)),
+        ("bucket_stress_max", np.float32, (num_buckets,)),
+    ])
+
+
+def empty_session(dtype):
+    record = np.zeros(1, dtype=dtype)
+    record["bucket_keys"] = -1
+    return record
+
+
+class SessionHistory:
+    """Ring buffers of one session's samples plus rolling and bucketed sums.
+
+    Kept in memory, or in the file at `path` when given (created by the first push).
+    """
+
+    def __init__(self, labels, capacity=SESSION_HISTORY_SIZE, window=STRESS_WINDOW,
+                 bucket_seconds=HISTORY_BUCKET_SECONDS, num_buckets=HISTORY_BUCKETS, path=None):
+        self.labels = list(labels)
+        classes = len(self.labels)
+        self.capacity = max(1, capacity)
+        self.window = max(1, min(window, self.capacity))
+        self.bucket_seconds = bucket_seconds
+        self.num_buckets = max(1, num_buckets)
+        self.path = path
+        self._stress_mask = np.array([label in STRESS_EMOTIONS for label in self.labels])
+        self._dtype = session_dtype(classes, self.capacity, self.num_buckets)
+        self._memory = empty_session(self._dtype) if path is None else None
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def _record(self, write=False):
+        """The session's record under a lock, or None if its file does not exist yet.
+
+        File-backed records are read on entry and, with write=True, written back
+        on exit (creating the file first if needed).
+        """
+        if self.path is None:
+            with self._lock:
+                yield self._memory[0]
+            return
+        try:
+            file = open(self.path, "r+b" if write else "rb")
+        except FileNotFoundError:
+            if not write:
+                yield None
+                return
+            create_session_file(self.path, self._dtype)
+            file = open(self.path, "r+b")
+        with file:
+            # flock belongs to this open file, so it also keeps other threads out
+            if fcntl is not None:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX if write else fcntl.LOCK_SH)
+            record = np.fromfile(file, dtype=self._dtype, count=1)
+            if len(record) != 1 or os.fstat(file.fileno()).st_size != self._dtype.itemsize:
+                # Left over from a different configuration (labels or buffer sizes): start over
+                record = empty_session(self._dtype)
+            yield record[0]
+            if write:
+                file.seek(0)
+                file.truncate()
+                file.write(record.tobytes())
+
+    @property
+    def count(self):
+        with self._record() as record:
+            return 0 if record is None else int(record["count"])
+
+    def push(self, timestamp, probabilities):
+        """Record one sample. Samples not newer than the last one are ignored,
+        so re-reading the same result does not count it twice."""
+        probabilities = np.asarray(probabilities, dtype=np.float32).reshape(-1)
+        stress = float(probabilities[self._stress_mask].sum())
+        with self._record(write=True) as r:
+            count = int(r["count"])
+            if count and timestamp <= r["times"][(count - 1) % self.capacity]:
+                return False
+            slot = count % self.capacity
+            if count >= self.window:
+                # The sample leaving the window is still in the ring (window <= capacity)
+                old = (count - self.window) % self.capacity
+                r["window_probabilities"] -= r["probabilities"][old]
+                r["window_stress"] -= float(r["stress"][old])
+            r["times"][slot] = timestamp
+            r["probabilities"][slot] = probabilities
+            r["stress"][slot] = stress
+            r["window_probabilities"] += probabilities
+            r["window_stress"] += stress
+            r["count"] = count + 1
+
+            key = int(timestamp // self.bucket_seconds)
+            bucket = key % self.num_buckets
+            if r["bucket_keys"][bucket] != key:
+                r["bucket_keys"][bucket] = key
+                r["bucket_counts"][bucket] = 0
+                r["bucket_probabilities"][bucket] = 0.0
+                r["bucket_stress"][bucket] = 0.0
+                r["bucket_stress_max"][bucket] = 0.0
+            r["bucket_counts"][bucket] += 1
+            r["bucket_probabilities"][bucket] += probabilities
+            r["bucket_stress"][bucket] += stress
+            r["bucket_stress_max"][bucket] = max(r["bucket_stress_max"][bucket], stress)
+        return True
+
+    def rolling(self):
+        """Mean probabilities and stress over the last `window` samples, or None if empty."""
+        with self._record() as r:
+            count = 0 if r is None else int(r["count"])
+            n = min(count, self.window)
+            if not n:
+                return None
+            probabilities = r["window_probabilities"] / n
+            stress = float(r["window_stress"]) / n
+            last = float(r["times"][(count - 1) % self.capacity])
+        return {
+            "samples": n,
+            "emotion": self.labels[int(np.argmax(probabilities))],
+            "stress": round(max(0.0, stress), 4),
+            "probabilities": {label: round(float(p), 4) for label, p in zip(self.labels, probabilities)},
+            "updated": last,
+        }
+
+    def history(self, seconds=None, points=60, now=None):
+        """Bucket means over the last `seconds` (default: everything kept),
+        merged down to at most `points` entries, oldest first."""
+        now = time.time() if now is None else now
+        with self._record() as r:
+            if r is None:
+                return []
+            keys = r["bucket_keys"].copy()
+            counts = r["bucket_counts"].copy()
+            probabilities = r["bucket_probabilities"].copy()
+            stress = r["bucket_stress"].copy()
+            stress_max = r["bucket_stress_max"].copy()
+
+        newest = int(now // self.bucket_seconds)
+        oldest = newest - self.num_buckets + 1
+        if seconds is not None and math.isfinite(seconds):
+            oldest = max(oldest, newest - int(seconds // self.bucket_seconds))
+        valid = (keys >= oldest) & (keys <= newest) & (counts > 0)
+        order = np.argsort(keys[valid])
+        keys, counts = keys[valid][order], counts[valid][order]
+        probabilities, stress, stress_max = probabilities[valid][order], stress[valid][order], stress_max[valid][order]
+        if not len(keys):
+            return []
+
+        # Merge neighbouring buckets so the result has at most `points` entries
+        span = max(1, -(-(newest - oldest + 1) // max(1, points)))
+        groups = (keys - oldest) // span
+        starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+        counts = np.add.reduceat(counts, starts)
+        probabilities = np.add.reduceat(probabilities, starts) / counts[:, np.newaxis]
+        stress = np.add.reduceat(stress, starts) / counts
+        stress_max = np.maximum.reduceat(stress_max, starts)
+        return [{
+            "time": float((oldest + group * span) * self.bucket_seconds),
+            "seconds": float(span * self.bucket_seconds),
+            "samples": int(n),
+            "stress": round(float(s), 4),
+            "stress_max": round(float(m), 4),
+            "probabilities": [round(float(p), 4) for p in row],
+        } for group, n, s, m, row in zip(groups[starts], counts, stress, stress_max, probabilities)]
+
+
+def create_session_file(path, dtype):
+    """Create an empty session file unless one exists.
+
+    The file is built aside and linked into place, so concurrent creators
+    agree on one file and nobody reads a half-written one.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    empty_session(dtype).tofile(tmp_path)
+    try:
+        os.link(tmp_path, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(tmp_path)
+
+
+class SessionStore:
+    """SessionHistory per session id, shared between processes through files in `directory`.
+
+    Handing out a history is free: its file appears with the first sample.
+    Files untouched for `ttl` seconds, and the oldest beyond max_sessions, are
+    deleted at most every prune_seconds.
+    """
+
+    def __init__(self, labels, max_sessions=SESSION_MAX, directory=SESSION_DIR,
+                 ttl=SESSION_TTL_SECONDS, prune_seconds=60.0, **history_options):
+        self.labels = list(labels)
+        self.max_sessions = max(1, max_sessions)
+        self.directory = directory
+        self.ttl = ttl
+        self.prune_seconds = prune_seconds
+        self.history_options = history_options
+        self._next_prune = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, session_id):
+        # Hashed, so any cookie value makes a safe file name
+        return os.path.join(self.directory, hashlib.blake2b(session_id.encode(), digest_size=16).hexdigest()
+                            + ".session")
+
+    def get(self, session_id, create=True):
+        """The session's history; with create=False, None unless it has samples on disk."""
+        self.prune()
+        path = self.path(session_id)
+        if not create and not os.path.exists(path):
+            return None
+        return SessionHistory(self.labels, path=path, **self.history_options)
+
+    def prune(self, force=False):
+        """Delete expired session files and the oldest beyond max_sessions."""
+        if not force and time.monotonic() < self._next_prune:
+            return
+        self._next_prune = time.monotonic() + self.prune_seconds
+        now = time.time()
+        files = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".session"):
+                    try:
+                        files.append((entry.stat().st_mtime, entry.path))
+                    except FileNotFoundError:
+                        continue
+        files.sort(reverse=True)
+        for i, (mtime, path) in enumerate(files):
+            if i >= self.max_sessions or mtime + self.ttl <= now:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass